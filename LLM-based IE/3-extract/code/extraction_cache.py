@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Settings overridable through environment variables
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "invasion-biology-IE", "extractions")
+DEFAULT_MAX_MB = 1024
+
+def extraction_key(model, messages, params, schema=None):
+    """Hash everything that determines a model response: model, prompt messages, sampling parameters, and schema.
+
+    The messages hold the system prompt and the paper's title, abstract, or full text, so the key changes
+    exactly when the effective input of a request changes, whatever DOI the paper is filed under.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params, "schema": schema},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ExtractionCache:
+    """On-disk cache of model responses keyed by extraction_key, evicting least recently used entries by size.
+
+    Entries are stored as one small JSON file each, sharded into subfolders by the first two hex digits of
+    the key. A cache hit refreshes the file's modification time, which serves as the LRU clock.
+    """
+
+    def __init__(self, directory=None, max_mb=None):
+        self.directory = directory or os.environ.get("EXTRACTION_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = float(max_mb if max_mb is not None else os.environ.get("EXTRACTION_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 2**20
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = sum(entry[2] for entry in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self):
+        """Yield (path, mtime, size) for every cache entry."""
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """Return the cached response text for a key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                content = json.load(file)["content"]
+        except (OSError, ValueError, KeyError):
+            with self.lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # Evicted by another process in the meantime
+        with self.lock:
+            self.hits += 1
+        return content
+
+    def put(self, key, content, model=None):
+        """Store a response text under a key, then evict old entries if the cache is over its size limit."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"model": model, "created": time.time(), "content": content}, ensure_ascii=False).encode("utf-8")
+
+        # Write to a temporary file first so that readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.size += len(data) - previous_size
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is at 90% of its size limit."""
+        target = self.max_bytes * 0.9
+        for path, _, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                pass
+
+    def print_summary(self):
+        print(f"Extraction cache: {self.hits} hits, {self.misses} misses, {self.size / 2**20:.1f} MB in {self.directory}")
@@ -0,0 +1,145 @@
+import csv
+import json
+import os
+import threading
+from functools import lru_cache
+
+# tiktoken gives exact token counts; without it counts are estimated at about 4 characters per token
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROMPT_FILE = os.path.join(CODE_DIR, "..", "data", "system-prompt.txt")
+SCHEMA_FILE = os.path.join(CODE_DIR, "..", "..", "2-generalize", "data", "schema-finalized.json")
+
+# Encoding used by gpt-4o
+TOKENIZER_ENCODING = "o200k_base"
+
+# OpenAI caches prompt prefixes only from this many tokens on
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# The user message of each input type only labels the paper's text. The instructions for each input type are part
+# of the system prompt, which keeps the shared prefix above PROMPT_CACHE_MIN_TOKENS
+USER_PROMPTS = {
+    "title_abstract": "Title: {title}\nAbstract: {abstract}",
+    "full_text": "Full text:\n\n{full_text}",
+    "full_text_chunk": "Title: {title}\n\nPart of the full text:\n\n{full_text}",
+}
+
+@lru_cache(maxsize=None)
+def load_schema(schema_file=SCHEMA_FILE):
+    """Load the finalized extraction schema (once per process; the returned object must not be modified)."""
+    with open(schema_file, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+@lru_cache(maxsize=None)
+def get_system_prompt(prompt_file=PROMPT_FILE, schema_file=SCHEMA_FILE):
+    """Assemble the system prompt from the prompt template and the finalized schema.
+
+    The prompt is built once per process and is byte-identical across requests, so that the
+    provider's prompt cache can reuse it. Everything that varies per paper goes in the user message.
+    """
+    with open(prompt_file, "r", encoding="utf-8") as file:
+        template = file.read()
+    schema = json.dumps(load_schema(schema_file), indent=2).replace("\n", "\n\t")
+    return template.replace("{schema}", schema)
+
+def build_messages(input_type="title_abstract", **fields):
+    """Build the chat messages for one paper: the shared system prompt followed by the paper's text."""
+    if input_type not in USER_PROMPTS:
+        raise ValueError("Invalid input type.")
+    return [
+        {"role": "system", "content": get_system_prompt()},
+        {"role": "user", "content": USER_PROMPTS[input_type].format(**fields)},
+    ]
+
+@lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.get_encoding(TOKENIZER_ENCODING) if tiktoken is not None else None
+
+# The shared system prompt is counted once and then served from the cache
+@lru_cache(maxsize=16)
+def count_tokens(text):
+    """Count the tokens of a text with the model's tokenizer, or estimate them if tiktoken is not installed."""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages):
+    """Count the prompt tokens of a list of chat messages, including the few tokens of framing per message."""
+    return sum(count_tokens(message["content"]) + 4 for message in messages) + 2
+
+def describe_system_prompt():
+    """Print the size of the system prompt and whether it is long enough for provider-side prompt caching."""
+    tokens = count_tokens(get_system_prompt())
+    print(f"System prompt: {tokens} tokens{'' if tiktoken is not None else ' (estimated; install tiktoken for exact counts)'}")
+    if tokens < PROMPT_CACHE_MIN_TOKENS:
+        print(f"Note: prompts shorter than {PROMPT_CACHE_MIN_TOKENS} tokens are not eligible for prompt caching.")
+
+def _usage_value(usage, *path):
+    """Read a nested usage field from an API response object or a batch result dictionary."""
+    value = usage
+    for name in path:
+        if value is None:
+            return 0
+        value = value.get(name) if isinstance(value, dict) else getattr(value, name, None)
+    return value or 0
+
+class TokenLedger:
+    """Records the prompt, cached-prompt, and completion tokens of every request in a CSV file."""
+    FIELDS = ["doi", "local_prompt_tokens", "prompt_tokens", "cached_tokens", "completion_tokens", "latency_seconds"]
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.totals = {"requests": 0, "local_prompt_tokens": 0, "prompt_tokens": 0,
+                       "cached_tokens": 0, "completion_tokens": 0, "latency_seconds": 0.0}
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=self.FIELDS)
+        if write_header:
+            self.writer.writeheader()
+
+    def record(self, doi, usage, local_prompt_tokens=0, latency_seconds=0.0):
+        """Record the usage reported for one request (an API usage object or a batch result dictionary)."""
+        row = {
+            "doi": doi,
+            "local_prompt_tokens": local_prompt_tokens,
+            "prompt_tokens": _usage_value(usage, "prompt_tokens"),
+            "cached_tokens": _usage_value(usage, "prompt_tokens_details", "cached_tokens"),
+            "completion_tokens": _usage_value(usage, "completion_tokens"),
+            "latency_seconds": round(latency_seconds, 3),
+        }
+        with self.lock:
+            self.writer.writerow(row)
+            self.file.flush()
+            self.totals["requests"] += 1
+            for name in self.FIELDS[1:]:
+                self.totals[name] += row[name]
+
+    def print_summary(self):
+        """Print the token totals and per-request averages of this run."""
+        totals = self.totals
+        requests = totals["requests"]
+        if not requests:
+            print("No token usage recorded.")
+            return
+        cached_share = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0
+        print(f"\nToken usage over {requests} requests (details in {self.path}):")
+        print(f"  Prompt tokens: {totals['prompt_tokens']} ({totals['prompt_tokens'] / requests:.0f} per request, "
+              f"{totals['local_prompt_tokens'] / requests:.0f} counted locally)")
+        print(f"  Cached prompt tokens: {totals['cached_tokens']} ({cached_share:.1%} of prompt tokens)")
+        print(f"  Completion tokens: {totals['completion_tokens']} ({totals['completion_tokens'] / requests:.0f} per request)")
+        print(f"  Average latency: {totals['latency_seconds'] / requests:.2f}s")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,234 @@
+import json
+import re
+
+from extraction_prompt import count_tokens
+
+# Section headings commonly found in paper full texts, optionally numbered ("2. Materials and methods", "III. RESULTS")
+SECTION_NAMES = (
+    r"abstract|introduction|background|study (?:area|site)s?|(?:materials? and )?methods?|methodology|"
+    r"materials?|experimental design|results?(?: and discussion)?|discussion|conclusions?|concluding remarks|"
+    r"summary|references?|literature cited|bibliography|acknowledge?ments?|funding|"
+    r"conflicts? of interest|competing interests?|declaration of competing interest|author contributions?|"
+    r"data availability(?: statement)?|supplementary (?:material|information|data)|appendix(?: [a-z0-9]+)?"
+)
+HEADING_PATTERN = re.compile(
+    rf"^\s*(?:(?:\d+(?:\.\d+)*|[ivx]+)[.)]?\s+)?(?:{SECTION_NAMES})\s*:?\s*$",
+    re.IGNORECASE,
+)
+
+# A heading inside a line, as in full texts whose line breaks were flattened into spaces (e.g. by clean_text in
+# scripts/ask-doi-list-fulltext-search.py): a capitalized section name at the start of the text, after the end of a
+# sentence, or after a run of spaces, followed by a capitalized word or the end of the text
+INLINE_HEADING = re.compile(
+    rf"(?:^|(?<=[.!?:;)\]\"'])\s+|\s{{2,}})"
+    rf"(?P<heading>(?:(?:\d+(?:\.\d+)*|[IVX]+)[.)]?\s+)?(?i:{SECTION_NAMES}))"
+    rf"(?=\s+[A-Z0-9(\[\"'“]|\s*$)"
+)
+NUMBERING = re.compile(r"^\s*(?:\d+(?:\.\d+)*|[ivx]+)[.)]?\s+", re.IGNORECASE)
+
+# Sections that may follow back matter, so that in the back part of a text an inline heading ends a back-matter
+# section only if it names one of these or more back matter; other section names inside a reference list are
+# usually journal titles ("Methods Ecol. Evol.")
+LATE_SECTIONS = re.compile(r"supplementary (?:material|information|data)|appendix(?: [a-z0-9]+)?", re.IGNORECASE)
+
+# Fraction of a text after which back matter is expected. Before it, a back-matter heading is more likely a false
+# positive ("Funding agencies ..."), so the next body heading ends the dropped section instead of the rest of the
+# paper being dropped
+BACK_PART_START = 0.5
+
+# Sections that carry no information about species, locations, habitats, or ecosystems
+DROPPED_SECTIONS = re.compile(
+    r"references?|literature cited|bibliography|acknowledge?ments?|funding|conflicts? of interest|"
+    r"competing interests?|declaration of competing interest|author contributions?|data availability",
+    re.IGNORECASE,
+)
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+ENTITY_KEYS = ["species", "location", "ecosystem", "habitat"]
+EMPTY_VALUES = (None, "", "-", "N/A")
+
+def _section_name(heading):
+    return NUMBERING.sub("", heading).strip(" :")
+
+def _inline_headings(line, heading, back_part_from=0):
+    """Yield the inline headings of a line as (start, end, heading), given the heading of the section it starts in.
+
+    Inside a back-matter section, body headings from position back_part_from of the line on are not recognized.
+    """
+    for match in INLINE_HEADING.finditer(line):
+        name = _section_name(match.group("heading"))
+        if not name[:1].isupper():
+            continue
+        if (is_dropped_section(heading) and match.start() >= back_part_from
+                and not (is_dropped_section(name) or LATE_SECTIONS.fullmatch(name))):
+            continue
+        heading = match.group("heading").strip()
+        yield match.start(), match.end(), heading
+
+def split_sections(text):
+    """Split a full text into (heading, body) pairs at recognized section headings.
+
+    Headings are recognized on lines of their own and, for full texts flattened into a single line,
+    inside lines. Text before the first heading is returned under an empty heading. Inside back matter in the
+    back part of the text, only back-matter and appendix headings are recognized inline.
+    """
+    sections = []
+    heading, lines = "", []
+    back_part_start, offset = int(len(text) * BACK_PART_START), 0
+
+    def start_section(new_heading):
+        nonlocal heading, lines
+        if any(l.strip() for l in lines):
+            sections.append((heading, "\n".join(lines).strip()))
+        heading, lines = new_heading, []
+
+    for line in text.splitlines():
+        line_offset, offset = offset, offset + len(line) + 1
+        if len(line) < 80 and HEADING_PATTERN.match(line):
+            start_section(line.strip())
+            continue
+        position = 0
+        for start, end, inline_heading in _inline_headings(line, heading, back_part_start - line_offset):
+            lines.append(line[position:start])
+            start_section(inline_heading)
+            position = end
+        lines.append(line[position:])
+    start_section("")
+    return sections
+
+def is_dropped_section(heading):
+    """Tell whether a section heading names back matter such as references or acknowledgements."""
+    name = _section_name(heading)
+    return bool(name) and DROPPED_SECTIONS.fullmatch(name) is not None
+
+def _split_by_tokens(text, max_tokens):
+    """Split a text into pieces of at most max_tokens tokens, at the last space that fits where there is one."""
+    pieces = []
+    while count_tokens(text) > max_tokens:
+        # Longest prefix within the budget
+        low, high = 1, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        space = text.rfind(" ", 0, low + 1)
+        end = space if space > 0 else low
+        pieces.append(text[:end])
+        text = text[end:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+def _split_oversized(text, max_tokens):
+    """Split a passage that exceeds the budget at paragraph, then sentence, then word boundaries."""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_BOUNDARY.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+            else:
+                # A single "sentence" longer than the budget, e.g. a flattened table
+                pieces.extend(_split_by_tokens(sentence, max_tokens))
+    return pieces
+
+def chunk_full_text(text, max_tokens=6000):
+    """Split a full text into chunks of at most max_tokens tokens, keeping sections together where possible.
+
+    Back-matter sections are dropped. Sections are packed into chunks in order; a section that does not fit
+    in one chunk is split at paragraph and sentence boundaries, and each chunk it continues into starts with
+    the section heading again.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n\n".join(current))
+        current, current_tokens = [], 0
+
+    for heading, body in split_sections(text):
+        if is_dropped_section(heading):
+            continue
+        section = f"{heading}\n{body}" if heading else body
+        # One extra token per part covers the separators between parts
+        tokens = count_tokens(section) + 1
+        if tokens <= max_tokens:
+            if current_tokens + tokens > max_tokens:
+                flush()
+            current.append(section)
+            current_tokens += tokens
+            continue
+
+        heading_tokens = count_tokens(heading) + 1 if heading else 0
+        if heading:
+            if current_tokens + heading_tokens > max_tokens:
+                flush()
+            current.append(heading)
+            current_tokens += heading_tokens
+        for piece in _split_oversized(body, max_tokens - heading_tokens - 1):
+            piece_tokens = count_tokens(piece) + 1
+            if current_tokens + piece_tokens > max_tokens:
+                flush()
+                if heading:
+                    current.append(heading)
+                    current_tokens = heading_tokens
+            current.append(piece)
+            current_tokens += piece_tokens
+    flush()
+    return chunks
+
+def _name_key(name):
+    return " ".join(str(name).split()).casefold()
+
+def _fill_missing(target, source):
+    """Copy the values of source into target where target has no value."""
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _fill_missing(target[key], value)
+        elif target.get(key) in EMPTY_VALUES and value not in EMPTY_VALUES:
+            target[key] = value
+
+def merge_extractions(extractions):
+    """Merge the per-chunk extractions of one paper into a single schema-conformant extraction.
+
+    Entities are deduplicated by case-folded name, and relationships by name and set of related entities.
+    Properties missing from the first mention are filled in from later ones. Returns None if no chunk
+    found anything relevant.
+    """
+    merged = {key: {} for key in ENTITY_KEYS + ["relationships"]}
+    relevant = False
+    for extraction in extractions:
+        if not isinstance(extraction, dict):
+            continue  # N/A for this chunk
+        relevant = True
+        for key in ENTITY_KEYS:
+            for entity in extraction.get(key) or []:
+                if not isinstance(entity, dict) or not entity.get("name"):
+                    continue
+                name_key = _name_key(entity["name"])
+                if name_key in merged[key]:
+                    _fill_missing(merged[key][name_key], entity)
+                else:
+                    merged[key][name_key] = json.loads(json.dumps(entity))
+        for relationship in extraction.get("relationships") or []:
+            if not isinstance(relationship, dict):
+                continue
+            properties = relationship.get("relationship_properties") or {}
+            relationship_key = (
+                _name_key(properties.get("name", "")),
+                frozenset(_name_key(entity) for entity in relationship.get("related_entities") or []),
+            )
+            if relationship_key in merged["relationships"]:
+                _fill_missing(merged["relationships"][relationship_key], relationship)
+            else:
+                merged["relationships"][relationship_key] = json.loads(json.dumps(relationship))
+    if not relevant:
+        return None
+    return {key: list(values.values()) for key, values in merged.items()}
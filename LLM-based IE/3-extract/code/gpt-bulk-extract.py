@@ -1,214 +1,537 @@
 import os
-import csv
+import sys
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from openai import OpenAI
+from extraction_cache import ExtractionCache, extraction_key
+from extraction_prompt import TokenLedger, build_messages, count_message_tokens, describe_system_prompt, load_schema
+from fulltext_chunking import chunk_full_text, merge_extractions
+from relevance_filter import PREFILTER_MARKER, RelevanceFilter
+from schema_validator import ExtractionValidator, Validation
+from work_queue import DEAD, FAILED, WorkQueue
+
+# Shared helpers live in the repository's scripts folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "scripts"))
+from corpus_store import corpus_columns, iter_corpus_rows
+from extraction_store import STORE_FILE, ExtractionStore, detect_layout, open_extraction_store
+from rate_limiter import TokenBucket
+
+# Model and sampling settings shared by the synchronous and batch modes
+MODEL = "gpt-4o"
+MAX_TOKENS = 2048
+SAMPLING_PARAMS = {
+    "temperature": 1,
+    "max_tokens": MAX_TOKENS,
+    "top_p": 1,
+    "frequency_penalty": 0,
+    "presence_penalty": 0,
+}
+
+# Output format requested from the model: "text", "json" (JSON mode), or "structured" (schema-constrained)
+RESPONSE_FORMAT = "text"
+
+# Token budget of each full-text chunk sent to the model
+CHUNK_TOKENS = 6000
+
+# Per-request token usage is appended to this file in the output folder
+TOKEN_USAGE_FILE = "token-usage.csv"
+
+# State, attempts, and errors of every DOI are kept in this SQLite file in the output folder
+WORK_QUEUE_FILE = "extraction-queue.sqlite"
+
+# The Batch API accepts at most this many requests per input file
+BATCH_MAX_REQUESTS = 50000
 
 def get_openai_api_key():
     """Prompt the user for the OpenAI API key."""
     return input("Enter your OpenAI API key: ").strip()
 
 def get_file_locations():
-    """Prompt the user for the input CSV file and output folder locations."""
-    input_csv = input("Enter the path to the input CSV file: ").strip()
-    output_folder = input("Enter the path to the output folder: ").strip()
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    return input_csv, output_folder
+    """Prompt the user for the input CSV or Parquet file and output folder locations."""
+    input_csv = input("Enter the path to the input CSV or Parquet file: ").strip()
+    return input_csv, get_output_folder()
 
 def sanitize_filename(filename):
     """Sanitize a file name to remove or replace invalid characters."""
     return re.sub(r'[<>:"/\\|?*]', '_', filename)
 
-def get_processed_dois(output_folder):
-    """Retrieve the list of already processed DOIs from the output folder."""
-    processed_dois = set()
-    for filename in os.listdir(output_folder):
-        if filename.endswith(".json") or filename.endswith(".txt"):
-            processed_doi = os.path.splitext(filename)[0]
-            processed_dois.add(processed_doi)
-    return processed_dois
-
-def validate_extraction(cleaned_data):
-    """Validate the extracted data against the schema."""
-    try:
-        json_data = json.loads(cleaned_data)
-        required_keys = ["species", "location", "ecosystem", "habitat", "relationships"]
-        
-        # Check for missing keys in the schema
-        missing_keys = [key for key in required_keys if key not in json_data]
-        if missing_keys:
-            print(f"Validation failed: Missing keys - {missing_keys}")
-            return False
-
-        return True
-    except json.JSONDecodeError as e:
-        print(f"Validation failed: JSON decode error - {e}")
-        print(f"Raw extracted data: {cleaned_data}")
-        return False
-    except Exception as e:
-        print(f"Validation failed: Unexpected error - {e}")
-        print(f"Raw extracted data: {cleaned_data}")
-        return False
+def request_params(validator, response_format=RESPONSE_FORMAT):
+    """Return the sampling parameters of a request, plus the response_format parameter unless plain text is asked for."""
+    params = dict(SAMPLING_PARAMS)
+    if validator.response_format(response_format) is not None:
+        params["response_format"] = validator.response_format(response_format)
+    return params
 
-def extract_information(client, title, abstract):
-    """Extract information using OpenAI API."""
-    system_instructions = """
-	**Your role**
-    You are a research assistant specializing in invasion biology or ecology. Your primary task is to read and analyze the content of provided papers to extract relevant information.
-
-    The field of invasion biology is defined as follows: a research area focusing on the translocation, establishment, spread, impact, and management of species outside of their native ranges, where they are referred to as non-native or alien species.
-
-    The information extraction task is centered on the following entities: species, habitat, location, and ecosystem.
-	
-	The entities are defined as:
-    1. **Species**: This includes both specific, formally named species (e.g., *Asterias amurensis*) and broader categories of organisms relevant to the study (e.g., "demersal fish" or "aquatic invertebrates"). These may include plants, animals, fungi, or microbes that are translocated to new environments, where they establish, spread, and potentially cause ecological or economic impacts. The term may also encompass higher-level taxonomic groups or functional groups when specific species are not identified in the text.
-    2. **Location**: The study site, which could range from a specific geographic feature (e.g., "Port Phillip Bay, southern Australia") to broader geopolitical regions (e.g., "southern Australia" or "the Amazon rainforest"). Locations may include natural features such as rivers, bays, or mountains, as well as administrative areas like cities, states, or countries.
-    3. **Ecosystem**: A system comprising interacting biological and abiotic components. Ecosystems often extend beyond specific locations (e.g., the savannah ecosystem spans geopolitical boundaries such as Kenya and Tanzania).
-    4. **Habitat**: A subcomponent of an ecosystem where a specific organism lives. For example, crocodiles inhabit freshwater habitats (e.g., rivers) within the broader savannah ecosystem.
-
-	**Your tasks:**
-	1. Upon receiving an article, identify and extract data according to the predefined schema specified below. Record values for each entity specified in the schema and relations between the extracted entities as well as their specified properties. If a property is not mentioned in the article, denote this with a "-".
-    2. Note that not all papers that might be provided by the user are addressing a problem in invasion biology. If you are provided a paper input that is not an invasion biology paper, return N/A as your response.	
-
-	**Extraction schema**
-	{
-	  "species": [
-		{
-		  "name": "species_name",
-		  "properties": {
-			"role": "native/introduced/alien/invasive",
-			"taxonomy_level": "species/genus/family"
-		  }
-		}
-	  ],
-	  "location": [
-		{
-		  "name": "location_name",
-		  "properties": {
-			"category": "natural/administrative",
-			"geopolitical_info": "country/region/city",
-			"additional_details": "climatic/physiographic"
-		  }
-		}
-	  ],
-	  "ecosystem": [
-		{
-		  "name": "ecosystem_name",
-		  "properties": {
-			"type": "aquatic/terrestrial/marine",
-			"scope": "local/regional/global"
-		  }
-		}
-	  ],
-	  "habitat": [
-		{
-		  "name": "habitat_name",
-		  "properties": {
-			"type": "aquatic/terrestrial/marine",
-			"subcomponent_of": "ecosystem_name",
-			"specifics": "e.g., benthic, litoral"
-		  }
-		}
-	  ],
-	  "relationships": [
-		{
-		  "related_entities": ["entity1", "entity2", "..."],
-		  "relationship_properties": {
-			"name": "relationship_name",
-			"type": "biological/physical/ecological/anthropogenic",
-			"directionality": "unidirectional/bidirectional",
-			"context": "relationship_contextual_description"
-		  }
-		}
-	  ]
-	}	
-
-	**Output Response Format:**
-	1. Your response must always be in valid JSON format conforming to the specified schema.
-	2. If the paper is not relevant to invasion biology, return:
-      "N/A"
+def extract_information(client, messages, params, ledger=None, doi=None):
+    """Extract information using OpenAI API, recording the request's token usage in the ledger if one is given.
+
+    Returns the raw response text, which is parsed and checked by the schema validator. API errors are
+    raised, so that the work queue can record their class.
     """
+    started = time.monotonic()
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=messages,
+        **params,
+    )
+    if ledger is not None:
+        ledger.record(doi, response.usage, count_message_tokens(messages), time.monotonic() - started)
+    return response.choices[0].message.content
 
-    user_message = f"Extract the information as instructed from this article title and abstract.\n\nTitle: {title}\nAbstract: {abstract}"
-    messages = [
-        {"role": "system", "content": system_instructions},
-        {"role": "user", "content": user_message},
-    ]
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=1,
-            max_tokens=2048,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0,
-        )
-        cleaned_data = response.choices[0].message.content.strip().removeprefix("```json").removesuffix("```").strip()
-        return cleaned_data
-    except Exception as e:
-        print(f"An error occurred during extraction: {e}")
-        return None
+def estimate_request_tokens(messages):
+    """Estimate the tokens a request counts against the tokens-per-minute limit: its prompt plus the completion budget."""
+    return count_message_tokens(messages) + MAX_TOKENS
 
-def process_csv(input_csv, output_folder, client):
-    """Read the input CSV, process each row, and write output files."""
-    csv.field_size_limit(10**7)
-    processed_dois = get_processed_dois(output_folder)
+def write_extraction(store, doi, doi_cleaned, validation):
+    """Write the validated extraction of one DOI to the extraction store, or "N/A" for N/A responses.
 
-    total_rows = 0
-    skipped_rows = 0
+    In the per-file layout these become a .json file and a .txt file, replacing an output of the other kind.
+    """
+    for warning in validation.warnings[:3]:
+        print(f"Warning for {doi}: {warning}")
+    if validation.status == "na":
+        print(f"Writing N/A response for {doi}.")
+        store.put(doi_cleaned, "N/A", doi)
+    elif validation.status == "valid":
+        print(f"Writing extracted data for {doi}.")
+        store.put(doi_cleaned, validation.data, doi)
+    else:
+        print(f"Invalid data format for {doi}: {'; '.join(validation.errors[:3])}")
+
+def iter_pending_rows(input_csv, processed_dois, counts, full_text=False, only=None, found=None):
+    """Yield (doi, doi_cleaned, title, abstract, full_text) for the rows that still have to be extracted.
+
+    The full text is only read when requested, and is empty otherwise. If only is given, rows whose
+    sanitized DOI is not in it are passed over silently. If found is given, the sanitized DOI of every
+    yielded row is added to it.
+    """
+    # Only the needed columns are read; Parquet corpora are memory-mapped
+    columns = ['DOI', 'Title', 'Abstract'] + (['Full-text'] if full_text else [])
+    for row in iter_corpus_rows(input_csv, columns=columns):
+        counts['total'] += 1
+        doi = (row.get("DOI") or "").strip()
 
-    with open(input_csv, mode='r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        
-        if not {'Title', 'Abstract', 'DOI'}.issubset(reader.fieldnames):
-            print("Input CSV file must contain 'Title', 'Abstract', and 'DOI' headers.")
-            return
+        if not doi:
+            print(f"Row {counts['total']} without a DOI detected. Ignoring this row entirely.")
+            counts['skipped'] += 1
+            continue
 
-        for row in reader:
-            total_rows += 1
-            doi = row.get("DOI", "").strip()
+        doi_cleaned = sanitize_filename(doi.replace("/", "_"))
+        if only is not None and doi_cleaned not in only:
+            continue
+        if doi_cleaned in processed_dois:
+            print(f"Skipping already processed DOI: {doi}")
+            continue
+
+        print(f"Processing row {counts['total']}: DOI = {doi}")
+        if found is not None:
+            found.add(doi_cleaned)
+        yield (doi, doi_cleaned, (row.get("Title") or "").strip(), (row.get("Abstract") or "").strip(),
+               (row.get("Full-text") or "").strip())
+
+def prefilter_rows(rows, relevance_filter, store, counts, queue=None):
+    """Pass on the rows the relevance filter keeps; mark the others as N/A without calling the model,
+    in the work queue too if one is given."""
+    for row in rows:
+        doi, doi_cleaned, title, abstract, _ = row
+        if relevance_filter.is_relevant(f"{title}\n{abstract}"):
+            yield row
+            continue
+        print(f"Skipping {doi}: below the relevance threshold.")
+        counts['prefiltered'] += 1
+        store.put(doi_cleaned, PREFILTER_MARKER, doi)
+        if queue is not None:
+            queue.finish(doi_cleaned, na=True)
+
+def queued_rows(rows, queue, retrying=False):
+    """Mark each row as in flight in the work queue before it is extracted.
+
+    Outside of retry runs, DOIs whose backoff after a failure has not elapsed, and dead-lettered DOIs,
+    are left for the retry mode.
+    """
+    for row in rows:
+        doi, doi_cleaned = row[0], row[1]
+        waiting = None if retrying else queue.waiting_state(doi_cleaned)
+        if waiting == DEAD:
+            print(f"Skipping {doi}: it was dead-lettered after failing; use the retry mode with dead-lettered DOIs.")
+            continue
+        if waiting == FAILED:
+            print(f"Skipping {doi}: its last attempt failed and its next retry is not due yet.")
+            continue
+        queue.start(doi, doi_cleaned)
+        yield row
+
+def rate_limited_extract(client, doi, messages, params, validator, limiters, ledger=None, cache=None):
+    """Return the validated response to one request.
+
+    A cached response for this exact request is used if there is one. Otherwise the request waits for
+    request and token budget under the per-minute limits, and its response is cached unless it is invalid,
+    so that malformed responses are requested again.
+    """
+    if cache is not None:
+        key = extraction_key(MODEL, messages, params, load_schema())
+        cached_data = cache.get(key)
+        if cached_data is not None:
+            print(f"Using cached extraction for {doi}.")
+            return validator.validate(cached_data)
+
+    request_limiter, token_limiter = limiters
+    request_limiter.acquire()
+    token_limiter.acquire(estimate_request_tokens(messages))
+    response_text = extract_information(client, messages, params, ledger, doi)
+    validation = validator.validate(response_text)
+    if cache is not None and validation.status != "invalid":
+        cache.put(key, response_text, MODEL)
+    return validation
+
+def paper_requests(title, abstract, full_text="", chunk_tokens=CHUNK_TOKENS):
+    """Build the request messages for one paper: one request per full-text chunk if the paper has a full text,
+    otherwise a single request for its title and abstract."""
+    if full_text and full_text != "N/A":
+        chunks = chunk_full_text(full_text, chunk_tokens)
+        if chunks:
+            return [build_messages("full_text_chunk", title=title, full_text=chunk) for chunk in chunks]
+    return [build_messages(title=title, abstract=abstract)]
+
+def merge_chunk_responses(validator, outcomes):
+    """Combine the outcomes of the chunks of one paper into a single outcome.
+
+    Returns the error of the first failed chunk, or the first invalid response, if any, so that the
+    paper is retried as a whole.
+    """
+    for outcome in outcomes:
+        if isinstance(outcome, Exception) or outcome.status == "invalid":
+            return outcome
+    if len(outcomes) == 1:
+        return outcomes[0]
+    merged = merge_extractions([validation.data for validation in outcomes])
+    if merged is None:
+        return Validation("na", None, [], [])
+    return validator.validate_object(merged)
+
+def extract_concurrently(client, rows, validator, params, workers, requests_per_minute, tokens_per_minute,
+                         ledger=None, cache=None, chunk_tokens=CHUNK_TOKENS):
+    """Run extractions on a thread pool and yield (doi, doi_cleaned, outcome) as each paper completes.
+
+    The outcome is the validated response, or the exception that made the paper's extraction fail.
+
+    Full texts are split into chunks that are extracted concurrently and merged once all of them are back.
+    At most about workers * 2 requests are queued ahead, and all workers share the requests- and tokens-per-minute
+    budgets.
+    """
+    limiters = (
+        TokenBucket(requests_per_minute / 60, capacity=max(1, workers)),
+        TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute),
+    )
+    rows = iter(rows)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for doi, doi_cleaned, title, abstract, full_text in rows:
+                requests = paper_requests(title, abstract, full_text, chunk_tokens)
+                # [doi, doi_cleaned, responses by chunk, chunks still running]
+                paper = [doi, doi_cleaned, [None] * len(requests), len(requests)]
+                for index, messages in enumerate(requests):
+                    future = executor.submit(rate_limited_extract, client, doi, messages, params, validator,
+                                             limiters, ledger, cache)
+                    pending[future] = (paper, index)
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                paper, index = pending.pop(future)
+                try:
+                    paper[2][index] = future.result()
+                except Exception as e:
+                    paper[2][index] = e
+                paper[3] -= 1
+                if paper[3] == 0:
+                    yield paper[0], paper[1], merge_chunk_responses(validator, paper[2])
 
-            if not doi:
-                print(f"Row {total_rows} without a DOI detected. Ignoring this row entirely.")
-                skipped_rows += 1
+def process_csv(input_csv, output_folder, client, workers=1, requests_per_minute=500, tokens_per_minute=30000,
+                cache=None, reextract=False, full_text=False, chunk_tokens=CHUNK_TOKENS, relevance_filter=None,
+                response_format=RESPONSE_FORMAT, strict_enums=False, queue=None, only=None):
+    """Read the input CSV or Parquet corpus, extract each row concurrently, and write to the extraction store as results arrive.
+
+    With reextract, papers that already have output files are extracted again; together with the cache,
+    only papers whose model, prompt, or text changed since they were cached are sent to the API.
+    With full_text, papers are extracted from their full text in chunks where the corpus has one, and
+    from their title and abstract otherwise. With a relevance_filter, papers it scores as irrelevant are
+    marked N/A without calling the model. Every response is checked against the finalized schema;
+    with strict_enums, unexpected enumerated property values make a response invalid.
+    The state of every DOI is recorded in the work queue; with only, just the given sanitized DOIs
+    are extracted, which is how the retry mode drains failed DOIs.
+    Returns the sanitized DOIs of the input rows that were taken up for extraction.
+    """
+    counts = {'total': 0, 'skipped': 0, 'prefiltered': 0}
+
+    if not {'Title', 'Abstract', 'DOI'}.issubset(corpus_columns(input_csv)):
+        print("Input file must contain 'Title', 'Abstract', and 'DOI' headers.")
+        return set()
+    if full_text and 'Full-text' not in corpus_columns(input_csv):
+        print("Input file must contain a 'Full-text' header for full-text extraction.")
+        return set()
+    found = set()
+
+    with open_extraction_store(output_folder) as store:
+        processed_dois = set() if reextract else store.keys()
+        describe_system_prompt()
+        validator = ExtractionValidator(load_schema(), strict_enums)
+        params = request_params(validator, response_format)
+        rows = iter_pending_rows(input_csv, processed_dois, counts, full_text, only, found)
+        own_queue = queue is None
+        if own_queue:
+            queue = WorkQueue(os.path.join(output_folder, WORK_QUEUE_FILE))
+        if relevance_filter is not None:
+            rows = prefilter_rows(rows, relevance_filter, store, counts, queue)
+        rows = queued_rows(rows, queue, retrying=only is not None)
+        with TokenLedger(os.path.join(output_folder, TOKEN_USAGE_FILE)) as ledger:
+            results = extract_concurrently(client, rows, validator, params, workers, requests_per_minute,
+                                           tokens_per_minute, ledger, cache, chunk_tokens)
+            for doi, doi_cleaned, outcome in results:
+                if isinstance(outcome, Exception):
+                    state = queue.fail(doi_cleaned, type(outcome).__name__, outcome)
+                    print(f"Skipping {doi} due to extraction error ({state}): {outcome}")
+                    continue
+                write_extraction(store, doi, doi_cleaned, outcome)
+                if outcome.status == "invalid":
+                    queue.fail(doi_cleaned, "ValidationError", "; ".join(outcome.errors))
+                else:
+                    queue.finish(doi_cleaned, na=outcome.status == "na")
+
+            print(f"\nTotal rows processed: {counts['total']}")
+            print(f"Rows skipped due to missing DOI: {counts['skipped']}")
+            if relevance_filter is not None:
+                print(f"Rows skipped by the relevance filter: {counts['prefiltered']}")
+            ledger.print_summary()
+            if cache is not None:
+                cache.print_summary()
+            queue.print_summary()
+        if own_queue:
+            queue.close()
+    return found
+
+def retry_failed(input_csv, output_folder, client, include_dead=False, **options):
+    """Extract again only the DOIs recorded as failed in the work queue, waiting out their backoff,
+    until each of them is done or dead-lettered. With include_dead, dead-lettered DOIs are retried too."""
+    with WorkQueue(os.path.join(output_folder, WORK_QUEUE_FILE)) as queue:
+        if include_dead:
+            print(f"{queue.revive_dead()} dead-lettered DOIs will be retried.")
+        while True:
+            due = queue.due_failures()
+            if not due:
+                wait_seconds = queue.seconds_until_next_retry()
+                if wait_seconds is None:
+                    break
+                print(f"Waiting {wait_seconds:.0f}s for the next retry...")
+                time.sleep(wait_seconds)
                 continue
+            print(f"Retrying {len(due)} failed DOIs.")
+            # A failed DOI may still have the output of an earlier run, which the retry replaces
+            found = process_csv(input_csv, output_folder, client, reextract=True, queue=queue, only=due, **options)
+            # DOIs no longer in the input would otherwise be retried forever. DOIs that were retried and
+            # failed again already had their attempt counted, even if their backoff has elapsed since
+            for doi_cleaned in due - found:
+                queue.fail(doi_cleaned, "MissingFromInput", "The DOI is not in the input file.")
 
-            doi_cleaned = sanitize_filename(doi.replace("/", "_"))
-            if doi_cleaned in processed_dois:
-                print(f"Skipping already processed DOI: {doi}")
+def write_batch_requests(input_csv, output_folder, requests_jsonl, relevance_filter=None, response_format=RESPONSE_FORMAT):
+    """Write one Batch API request per pending DOI to a JSONL file, with the sanitized DOI as custom_id."""
+    counts = {'total': 0, 'skipped': 0, 'prefiltered': 0}
+
+    if not {'Title', 'Abstract', 'DOI'}.issubset(corpus_columns(input_csv)):
+        print("Input file must contain 'Title', 'Abstract', and 'DOI' headers.")
+        return 0
+
+    params = request_params(ExtractionValidator(load_schema()), response_format)
+    written = set()
+    with open_extraction_store(output_folder) as store, open(requests_jsonl, "w", encoding="utf-8") as jsonl_file:
+        rows = iter_pending_rows(input_csv, store.keys(), counts)
+        if relevance_filter is not None:
+            rows = prefilter_rows(rows, relevance_filter, store, counts)
+
+        for doi, doi_cleaned, title, abstract, _ in rows:
+            # custom_id must be unique within a batch
+            if doi_cleaned in written:
+                print(f"Skipping duplicate DOI: {doi}")
                 continue
+            request = {
+                "custom_id": doi_cleaned,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": MODEL, "messages": build_messages(title=title, abstract=abstract), **params},
+            }
+            jsonl_file.write(json.dumps(request) + "\n")
+            written.add(doi_cleaned)
 
-            title = row.get("Title", "").strip()
-            abstract = row.get("Abstract", "").strip()
+    print(f"\n{len(written)} batch requests written to {requests_jsonl}")
+    print(f"Rows skipped due to missing DOI: {counts['skipped']}")
+    if relevance_filter is not None:
+        print(f"Rows skipped by the relevance filter: {counts['prefiltered']}")
+    if len(written) > BATCH_MAX_REQUESTS:
+        print(f"Warning: the Batch API accepts at most {BATCH_MAX_REQUESTS} requests per file; split the file before submitting.")
+    return len(written)
 
-            print(f"Processing row {total_rows}: DOI = {doi}")
-            cleaned_data = extract_information(client, title, abstract)
+def ingest_batch_results(results_jsonl, output_folder, strict_enums=False):
+    """Write the extractions of a Batch API results file to the extraction store, validated like the synchronous path.
+
+    Each result counts as an attempt in the work queue, so that failed and invalid results are retried
+    and dead-lettered like synchronous ones.
+    """
+    validator = ExtractionValidator(load_schema(), strict_enums)
+    ingested = failed = 0
 
-            if cleaned_data is None:
-                print(f"Skipping {doi} due to extraction error.")
+    with open(results_jsonl, "r", encoding="utf-8") as jsonl_file, open_extraction_store(output_folder) as store, \
+            TokenLedger(os.path.join(output_folder, TOKEN_USAGE_FILE)) as ledger, \
+            WorkQueue(os.path.join(output_folder, WORK_QUEUE_FILE)) as queue:
+        processed_dois = store.keys()
+        for line in jsonl_file:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            doi_cleaned = result["custom_id"]
+            if doi_cleaned in processed_dois:
+                print(f"Skipping already processed DOI: {doi_cleaned}")
                 continue
 
-            if "N/A" in cleaned_data and len(cleaned_data) < 10:
-                print(f"Writing N/A response for {doi}.")
-                na_file_path = os.path.join(output_folder, f"{doi_cleaned}.txt")
-                with open(na_file_path, "w", encoding="utf-8") as na_file:
-                    na_file.write("N/A\n")
-            else:
-                if validate_extraction(cleaned_data):
-                    output_file_path = os.path.join(output_folder, f"{doi_cleaned}.json")
-                    print(f"Writing extracted data for {doi}.")
-                    with open(output_file_path, "w", encoding="utf-8") as json_file:
-                        json.dump(json.loads(cleaned_data), json_file, indent=4)
-                else:
-                    print(f"Invalid data format for {doi}.")
-    print(f"\nTotal rows processed: {total_rows}")
-    print(f"Rows skipped due to missing DOI: {skipped_rows}")
+            # The batch results only carry the sanitized DOI
+            queue.start(doi_cleaned, doi_cleaned)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                error = result.get("error") or response.get("body", {}).get("error")
+                state = queue.fail(doi_cleaned, "BatchError", error)
+                print(f"Skipping {doi_cleaned} due to extraction error ({state}): {error}")
+                failed += 1
+                continue
+
+            ledger.record(doi_cleaned, response["body"].get("usage"))
+            content = response["body"]["choices"][0]["message"]["content"]
+            validation = validator.validate(content)
+            write_extraction(store, doi_cleaned, doi_cleaned, validation)
+            if validation.status == "invalid":
+                queue.fail(doi_cleaned, "ValidationError", "; ".join(validation.errors))
+                failed += 1
+                continue
+            queue.finish(doi_cleaned, na=validation.status == "na")
+            ingested += 1
+
+        print(f"\nResults ingested: {ingested}")
+        print(f"Requests that failed in the batch or returned invalid data: {failed}")
+        ledger.print_summary()
+        queue.print_summary()
+
+def submit_batch(client, requests_jsonl):
+    """Upload a batch request file and start a batch job, returning its ID."""
+    with open(requests_jsonl, "rb") as jsonl_file:
+        batch_input = client.files.create(file=jsonl_file, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_input.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    print(f"Batch submitted: {batch.id} (status: {batch.status})")
+    return batch.id
+
+def collect_batch(client, batch_id, results_jsonl):
+    """Download the results of a finished batch job. Returns False while the job is still running."""
+    batch = client.batches.retrieve(batch_id)
+    print(f"Batch {batch_id} status: {batch.status}")
+    if batch.status != "completed":
+        return False
+
+    with open(results_jsonl, "wb") as results_file:
+        results_file.write(client.files.content(batch.output_file_id).content)
+    print(f"Results written to {results_jsonl}")
+
+    # Requests that failed inside the batch are reported in a separate file
+    if batch.error_file_id:
+        errors_jsonl = f"{os.path.splitext(results_jsonl)[0]}-errors.jsonl"
+        with open(errors_jsonl, "wb") as errors_file:
+            errors_file.write(client.files.content(batch.error_file_id).content)
+        print(f"Errors written to {errors_jsonl}")
+    return True
+
+def get_output_folder():
+    """Prompt the user for the output folder location, and for the layout of a folder without outputs yet."""
+    output_folder = input("Enter the path to the output folder: ").strip()
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    if detect_layout(output_folder) is None:
+        consolidated = input(f"Write all outputs to a single {STORE_FILE} instead of one file per DOI? (Y/n): ").strip().lower() != "n"
+        if consolidated:
+            # Creating the store file fixes the folder's layout for later runs and the insights scripts
+            ExtractionStore(os.path.join(output_folder, STORE_FILE)).close()
+    return output_folder
+
+def get_relevance_filter():
+    """Prompt the user for an optional relevance filter model trained with relevance_filter.py."""
+    model_path = input("Enter the path to a relevance filter model (leave empty to send every paper to the model): ").strip()
+    if not model_path:
+        return None
+    relevance_filter = RelevanceFilter.load(model_path)
+    print(f"Papers scoring below {relevance_filter.threshold:.2f} will be skipped.")
+    return relevance_filter
+
+def get_response_format():
+    """Prompt the user for the output format to request from the model."""
+    response_format = input("Request plain text, JSON mode, or structured output? (text/json/structured, default text): ").strip().lower()
+    return response_format if response_format in ("json", "structured") else "text"
+
+def get_rate_limits():
+    """Prompt the user for the number of concurrent requests and the account's per-minute limits."""
+    workers = int(input("Enter the number of concurrent requests (default 8): ").strip() or 8)
+    requests_per_minute = int(input("Enter the requests-per-minute limit (default 500): ").strip() or 500)
+    tokens_per_minute = int(input("Enter the tokens-per-minute limit (default 30000): ").strip() or 30000)
+    return workers, requests_per_minute, tokens_per_minute
 
 if __name__ == "__main__":
-    api_key = get_openai_api_key()
-    client = OpenAI(api_key=api_key)
-    input_csv, output_folder = get_file_locations()
-    process_csv(input_csv, output_folder, client)
+    print("Modes:")
+    print("  1. Extract synchronously")
+    print("  2. Write a batch request file")
+    print("  3. Submit a batch request file")
+    print("  4. Download the results of a batch")
+    print("  5. Ingest a batch results file")
+    print("  6. Retry failed extractions")
+    mode = input("Choose a mode (default 1): ").strip() or "1"
+
+    if mode == "2":
+        input_csv, output_folder = get_file_locations()
+        requests_jsonl = input("Enter the path to the batch request JSONL file to write: ").strip()
+        write_batch_requests(input_csv, output_folder, requests_jsonl, get_relevance_filter(), get_response_format())
+    elif mode == "5":
+        results_jsonl = input("Enter the path to the batch results JSONL file: ").strip()
+        output_folder = get_output_folder()
+        ingest_batch_results(results_jsonl, output_folder)
+    else:
+        api_key = get_openai_api_key()
+        # OPENAI_BASE_URL, if set, points the client at another OpenAI-compatible server such as mock-openai-server.py
+        client = OpenAI(api_key=api_key, max_retries=5)
+        if mode == "3":
+            requests_jsonl = input("Enter the path to the batch request JSONL file: ").strip()
+            submit_batch(client, requests_jsonl)
+        elif mode == "4":
+            batch_id = input("Enter the batch ID: ").strip()
+            results_jsonl = input("Enter the path to write the batch results JSONL file: ").strip()
+            collect_batch(client, batch_id, results_jsonl)
+        elif mode == "6":
+            input_csv, output_folder = get_file_locations()
+            workers, requests_per_minute, tokens_per_minute = get_rate_limits()
+            full_text = input("Extract from full texts where available? (y/N): ").strip().lower() == "y"
+            include_dead = input("Also retry dead-lettered DOIs? (y/N): ").strip().lower() == "y"
+            retry_failed(input_csv, output_folder, client, include_dead, workers=workers,
+                         requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                         cache=ExtractionCache(), full_text=full_text, response_format=get_response_format())
+        else:
+            input_csv, output_folder = get_file_locations()
+            workers, requests_per_minute, tokens_per_minute = get_rate_limits()
+            reextract = input("Re-extract papers that already have output files? (y/N): ").strip().lower() == "y"
+            full_text = input("Extract from full texts where available? (y/N): ").strip().lower() == "y"
+            relevance_filter = get_relevance_filter()
+            response_format = get_response_format()
+            # Responses are cached by input content under EXTRACTION_CACHE_DIR, limited to EXTRACTION_CACHE_MAX_MB
+            cache = ExtractionCache()
+            process_csv(input_csv, output_folder, client, workers, requests_per_minute, tokens_per_minute,
+                        cache, reextract, full_text, relevance_filter=relevance_filter, response_format=response_format)
@@ -0,0 +1,115 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned extraction returned for papers that look relevant to invasion biology
+CANNED_EXTRACTION = {
+    "species": [{"name": "Asterias amurensis", "properties": {"role": "invasive", "taxonomy_level": "species"}}],
+    "location": [{"name": "Port Phillip Bay", "properties": {
+        "category": "natural", "geopolitical_info": "southern Australia", "additional_details": "-"}}],
+    "ecosystem": [{"name": "temperate bay", "properties": {"type": "marine", "scope": "local"}}],
+    "habitat": [{"name": "soft sediment", "properties": {
+        "type": "marine", "subcomponent_of": "temperate bay", "specifics": "benthic"}}],
+    "relationships": [{
+        "related_entities": ["Asterias amurensis", "soft sediment"],
+        "relationship_properties": {"name": "preys on bivalves in", "type": "biological",
+                                    "directionality": "unidirectional", "context": "-"},
+    }],
+}
+
+# Answer to irrelevant papers when the request asks for JSON, which cannot be a bare "N/A"
+EMPTY_EXTRACTION = {key: [] for key in CANNED_EXTRACTION}
+
+# Keywords that decide whether the mock answers with an extraction or with "N/A"
+RELEVANT_KEYWORDS = ("invasi", "non-native", "alien", "introduced")
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1/chat/completions like the OpenAI API, after a simulated latency."""
+    latency = 1.0
+    jitter = 0.5
+    error_rate = 0.0
+    request_count = 0
+    count_lock = threading.Lock()
+    seen_system_prompts = set()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        system_prompt = next((m["content"] for m in body.get("messages", []) if m.get("role") == "system"), "")
+        with MockOpenAIHandler.count_lock:
+            MockOpenAIHandler.request_count += 1
+            # Like the real prompt cache, a repeated prefix of 1024+ tokens is served in 128-token blocks
+            prefix_tokens = len(system_prompt) // 4
+            cached_tokens = prefix_tokens // 128 * 128 if system_prompt in self.seen_system_prompts and prefix_tokens >= 1024 else 0
+            self.seen_system_prompts.add(system_prompt)
+
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        # Simulate rate-limit errors so that client retries can be exercised
+        if random.random() < self.error_rate:
+            self.send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests"}})
+            return
+
+        user_message = next((m["content"] for m in body.get("messages", []) if m.get("role") == "user"), "")
+        json_requested = "response_format" in body
+        if any(keyword in user_message.lower() for keyword in RELEVANT_KEYWORDS):
+            content = json.dumps(CANNED_EXTRACTION) if json_requested else "```json\n" + json.dumps(CANNED_EXTRACTION) + "\n```"
+        else:
+            content = json.dumps(EMPTY_EXTRACTION) if json_requested else "N/A"
+
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_chars // 4 + len(content) // 4,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        })
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Keep the console free for the request counter
+
+def serve(port=8000, latency=1.0, jitter=0.5, error_rate=0.0):
+    """Run the mock server until interrupted."""
+    MockOpenAIHandler.latency = latency
+    MockOpenAIHandler.jitter = min(jitter, latency)
+    MockOpenAIHandler.error_rate = error_rate
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockOpenAIHandler)
+    print(f"Mock OpenAI server listening on http://127.0.0.1:{port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Requests served: {MockOpenAIHandler.request_count}")
+
+if __name__ == "__main__":
+    port = int(input("Enter the port to listen on (default 8000): ").strip() or 8000)
+    latency = float(input("Enter the simulated latency per request in seconds (default 1.0): ").strip() or 1.0)
+    error_rate = float(input("Enter the fraction of requests answered with HTTP 429 (default 0): ").strip() or 0)
+    serve(port, latency, error_rate=error_rate)
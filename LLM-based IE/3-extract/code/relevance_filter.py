@@ -0,0 +1,178 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+
+# Shared helpers live in the repository's scripts folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "scripts"))
+from corpus_store import iter_corpus_rows
+from extraction_store import open_extraction_store
+
+# Marker written instead of a model response for papers the pre-filter skips
+PREFILTER_MARKER = "N/A (relevance pre-filter)"
+
+STOPWORDS = set("""
+a about above after again against all also an and any are as at be because been before being below between both
+but by can could did do does doing during each few for from further had has have having here how however i if in
+into is it its itself more most no nor not of on once only or other our out over own same should so some such than
+that the their them then there these they this those through to too under until up very was we were what when where
+which while who whom why will with within would
+""".split())
+
+def output_stem(doi):
+    """Name of a DOI's output file without extension, as written by gpt-bulk-extract.py."""
+    return re.sub(r'[<>:"/\\|?*]', '_', doi.replace("/", "_"))
+
+def features(text):
+    """Return the set of unigram and bigram features of a title and abstract."""
+    words = [word for word in re.findall(r"[a-z][a-z0-9-]+", text.lower()) if word not in STOPWORDS]
+    return set(words) | {f"{first} {second}" for first, second in zip(words, words[1:])}
+
+def in_holdout(key, holdout_percent=20):
+    """Assign a paper to the held-out set by a hash of its key, so the split is stable across runs."""
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % 100 < holdout_percent
+
+class RelevanceFilter:
+    """Naive Bayes classifier over binary unigram and bigram features of a paper's title and abstract.
+
+    score() returns the log-odds that a paper is relevant to invasion biology; papers scoring below the
+    threshold are skipped instead of being sent to the LLM.
+    """
+
+    def __init__(self, threshold=0.0, min_count=2):
+        self.threshold = threshold
+        self.min_count = min_count
+        self.documents = [0, 0]  # Irrelevant, relevant
+        self.weights = {}
+        self.prior = 0.0
+
+    def train(self, examples):
+        """Fit the classifier on (text, is_relevant) pairs."""
+        counts = [Counter(), Counter()]
+        self.documents = [0, 0]
+        for text, label in examples:
+            label = int(bool(label))
+            self.documents[label] += 1
+            counts[label].update(features(text))
+
+        # Laplace-smoothed log likelihood ratio of each feature that occurs often enough to be informative
+        self.weights = {}
+        for feature in counts[0].keys() | counts[1].keys():
+            if counts[0][feature] + counts[1][feature] < self.min_count:
+                continue
+            relevant = (counts[1][feature] + 1) / (self.documents[1] + 2)
+            irrelevant = (counts[0][feature] + 1) / (self.documents[0] + 2)
+            self.weights[feature] = math.log(relevant / irrelevant)
+        self.prior = math.log((self.documents[1] + 1) / (self.documents[0] + 1))
+        return self
+
+    def score(self, text):
+        """Return the log-odds that the paper with this title and abstract is relevant."""
+        return self.prior + sum(self.weights.get(feature, 0.0) for feature in features(text))
+
+    def is_relevant(self, text):
+        return self.score(text) >= self.threshold
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({
+                "threshold": self.threshold,
+                "min_count": self.min_count,
+                "documents": self.documents,
+                "prior": self.prior,
+                "weights": self.weights,
+            }, file)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        model = cls(data["threshold"], data["min_count"])
+        model.documents = data["documents"]
+        model.prior = data["prior"]
+        model.weights = data["weights"]
+        return model
+
+def load_examples(input_csv, output_folder):
+    """Label the corpus rows that already went through the LLM: an extraction is relevant, an N/A answer is not.
+
+    Papers skipped by the pre-filter itself are left out, since the LLM never judged them.
+    Returns a list of (doi_cleaned, text, is_relevant).
+    """
+    labels = {}
+    with open_extraction_store(output_folder) as store:
+        for record in store.iter_records():
+            if isinstance(record["data"], dict):
+                labels[record["key"]] = True
+            elif record["data"] == "N/A":
+                labels[record["key"]] = False
+
+    examples = []
+    for row in iter_corpus_rows(input_csv, columns=["DOI", "Title", "Abstract"]):
+        doi = (row.get("DOI") or "").strip()
+        stem = output_stem(doi) if doi else None
+        if stem in labels:
+            text = f"{(row.get('Title') or '').strip()}\n{(row.get('Abstract') or '').strip()}"
+            examples.append((stem, text, labels.pop(stem)))
+    return examples
+
+def evaluate(scored, threshold):
+    """Return precision and recall of the relevant class, and the share of papers skipped, at a threshold."""
+    kept = [label for score, label in scored if score >= threshold]
+    relevant_total = sum(label for _, label in scored)
+    true_positives = sum(kept)
+    precision = true_positives / len(kept) if kept else 0.0
+    recall = true_positives / relevant_total if relevant_total else 0.0
+    skipped = 1 - len(kept) / len(scored) if scored else 0.0
+    return precision, recall, skipped
+
+def choose_threshold(scored, min_recall):
+    """Pick the highest threshold that still keeps at least min_recall of the relevant papers."""
+    relevant_scores = sorted((score for score, label in scored if label), reverse=True)
+    if not relevant_scores:
+        return 0.0
+    keep = max(1, math.ceil(min_recall * len(relevant_scores)))
+    return relevant_scores[keep - 1]
+
+def train_and_evaluate(input_csv, output_folder, model_path, min_recall=0.98, threshold=None):
+    """Train on the hashed training split, report precision/recall on the held-out split, then save a model
+    trained on all labelled papers."""
+    examples = load_examples(input_csv, output_folder)
+    train = [(text, label) for key, text, label in examples if not in_holdout(key)]
+    holdout = [(text, label) for key, text, label in examples if in_holdout(key)]
+    print(f"Labelled papers: {len(examples)} ({sum(label for _, _, label in examples)} relevant); "
+          f"training on {len(train)}, holding out {len(holdout)}.")
+    if not train or not holdout:
+        print("Not enough labelled papers to train and evaluate the filter.")
+        return None
+
+    model = RelevanceFilter().train(train)
+    scored = [(model.score(text), label) for text, label in holdout]
+    if threshold is None:
+        threshold = choose_threshold(scored, min_recall)
+
+    print("\nHeld-out results (papers scoring below the threshold are skipped):")
+    print(f"{'Threshold':>10} {'Precision':>10} {'Recall':>8} {'Skipped':>8}")
+    for candidate in sorted({threshold, -10.0, -5.0, -2.0, 0.0, 2.0}):
+        precision, recall, skipped = evaluate(scored, candidate)
+        marker = "  <- selected" if candidate == threshold else ""
+        print(f"{candidate:>10.2f} {precision:>10.3f} {recall:>8.3f} {skipped:>8.1%}{marker}")
+
+    final_model = RelevanceFilter(threshold=threshold).train(train + holdout)
+    final_model.save(model_path)
+    print(f"\nModel saved to {model_path} with threshold {threshold:.2f}")
+    return final_model
+
+if __name__ == "__main__":
+    input_csv = input("Enter the path to the input CSV or Parquet file: ").strip()
+    output_folder = input("Enter the path to the folder with existing extraction outputs: ").strip()
+    model_path = input("Enter the path to save the filter model (default relevance-filter.json): ").strip() or "relevance-filter.json"
+    threshold = input("Enter a score threshold, or leave empty to choose one for a target recall: ").strip()
+    if threshold:
+        train_and_evaluate(input_csv, output_folder, model_path, threshold=float(threshold))
+    else:
+        min_recall = float(input("Enter the share of relevant papers that must be kept (default 0.98): ").strip() or 0.98)
+        train_and_evaluate(input_csv, output_folder, model_path, min_recall=min_recall)
@@ -0,0 +1,169 @@
+import json
+import re
+from collections import namedtuple
+
+# Properties whose schema value lists the allowed values, e.g. "native/introduced/alien/invasive"
+ENUM_PROPERTIES = {"role", "taxonomy_level", "type", "scope", "directionality"}
+
+# Values the model uses for "not stated", accepted for any property
+EMPTY_VALUES = {"", "-", "n/a", "unknown"}
+
+# Keys of a relationship, as opposed to the name/properties layout of the entity lists
+RELATIONSHIP_KEY = "relationships"
+
+FENCE_PATTERN = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+
+# status is "valid", "na" (not relevant to invasion biology), or "invalid"; data is the parsed extraction
+Validation = namedtuple("Validation", ["status", "data", "errors", "warnings"])
+
+def strip_code_fence(text):
+    """Remove a Markdown code fence around a response, whatever its language tag."""
+    match = FENCE_PATTERN.match(text)
+    return match.group(1).strip() if match else text.strip()
+
+def _enum_values(description):
+    return {value.strip().lower() for value in description.split("/") if value.strip()}
+
+class ExtractionValidator:
+    """Validator compiled once from the finalized schema, checking each model response in a single pass.
+
+    It checks the top-level lists, the shape of every entity and relationship, and the enumerated property
+    values. A value may combine allowed values with "/" or ",", and "-" marks a value that is not stated.
+    Enum violations are reported as warnings, or as errors with strict_enums.
+    """
+
+    def __init__(self, schema, strict_enums=False):
+        self.strict_enums = strict_enums
+        self.top_level_keys = list(schema)
+        self.entity_properties = {}
+        self.relationship_properties = {}
+        for key, template in schema.items():
+            item = template[0]
+            if key == RELATIONSHIP_KEY:
+                self.relationship_properties = self._compile_properties(item["relationship_properties"])
+            else:
+                self.entity_properties[key] = self._compile_properties(item["properties"])
+
+    @staticmethod
+    def _compile_properties(properties):
+        """Map each property name to its set of allowed values, or None if it is free text."""
+        return {name: _enum_values(value) if name in ENUM_PROPERTIES else None for name, value in properties.items()}
+
+    def validate(self, response_text):
+        """Parse and validate a raw model response."""
+        text = strip_code_fence(response_text or "")
+        if text.strip('"') == "N/A":
+            return Validation("na", None, [], [])
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            return Validation("invalid", None, [f"JSON decode error: {e}"], [])
+        return self.validate_object(data)
+
+    def validate_object(self, data):
+        """Validate an already parsed extraction."""
+        # JSON mode cannot answer with a bare string, so "N/A" may come back quoted or as an empty extraction
+        if data == "N/A":
+            return Validation("na", None, [], [])
+        if not isinstance(data, dict):
+            return Validation("invalid", None, ["The response is not a JSON object."], [])
+
+        errors, warnings = [], []
+        missing_keys = [key for key in self.top_level_keys if key not in data]
+        if missing_keys:
+            errors.append(f"Missing keys - {missing_keys}")
+        for key in self.top_level_keys:
+            items = data.get(key, [])
+            if not isinstance(items, list):
+                errors.append(f"'{key}' is not a list.")
+                continue
+            for index, item in enumerate(items):
+                where = f"{key}[{index}]"
+                if not isinstance(item, dict):
+                    errors.append(f"{where} is not an object.")
+                elif key == RELATIONSHIP_KEY:
+                    self._check_relationship(item, where, errors, warnings)
+                else:
+                    self._check_entity(item, self.entity_properties[key], where, errors, warnings)
+
+        if errors:
+            return Validation("invalid", data, errors, warnings)
+        if all(not data.get(key) for key in self.top_level_keys):
+            return Validation("na", None, [], warnings)
+        return Validation("valid", data, [], warnings)
+
+    def _check_entity(self, item, allowed, where, errors, warnings):
+        if not isinstance(item.get("name"), str) or not item["name"].strip():
+            errors.append(f"{where} has no name.")
+        properties = item.get("properties", {})
+        if not isinstance(properties, dict):
+            errors.append(f"{where}.properties is not an object.")
+            return
+        self._check_properties(properties, allowed, f"{where}.properties", errors, warnings)
+
+    def _check_relationship(self, item, where, errors, warnings):
+        entities = item.get("related_entities")
+        if not isinstance(entities, list) or not all(isinstance(entity, str) for entity in entities):
+            errors.append(f"{where}.related_entities is not a list of names.")
+        properties = item.get("relationship_properties", {})
+        if not isinstance(properties, dict):
+            errors.append(f"{where}.relationship_properties is not an object.")
+            return
+        self._check_properties(properties, self.relationship_properties, f"{where}.relationship_properties",
+                               errors, warnings)
+
+    def _check_properties(self, properties, allowed, where, errors, warnings):
+        for name, value in properties.items():
+            if name not in allowed:
+                warnings.append(f"{where} has an unknown property '{name}'.")
+                continue
+            if value is not None and not isinstance(value, str):
+                errors.append(f"{where}.{name} is not a string.")
+                continue
+            allowed_values = allowed[name]
+            if allowed_values is None or value is None or value.strip().lower() in EMPTY_VALUES:
+                continue
+            parts = {part.strip().lower() for part in re.split(r"[/,]|\band\b", value) if part.strip()}
+            if not parts <= allowed_values:
+                message = f"{where}.{name} has an unexpected value '{value}'."
+                (errors if self.strict_enums else warnings).append(message)
+
+    def json_schema(self):
+        """Return a JSON Schema of the extraction for structured output, with every field required."""
+        def object_schema(fields):
+            return {"type": "object", "properties": fields, "required": list(fields), "additionalProperties": False}
+
+        def properties_schema(allowed):
+            fields = {}
+            for name, values in allowed.items():
+                field = {"type": "string"}
+                if values is not None:
+                    field["description"] = f"One or more of: {', '.join(sorted(values))}, or '-' if not stated."
+                fields[name] = field
+            return object_schema(fields)
+
+        top_level = {}
+        for key in self.top_level_keys:
+            if key == RELATIONSHIP_KEY:
+                item = object_schema({
+                    "related_entities": {"type": "array", "items": {"type": "string"}},
+                    "relationship_properties": properties_schema(self.relationship_properties),
+                })
+            else:
+                item = object_schema({
+                    "name": {"type": "string"},
+                    "properties": properties_schema(self.entity_properties[key]),
+                })
+            top_level[key] = {"type": "array", "items": item}
+        return object_schema(top_level)
+
+    def response_format(self, mode):
+        """Return the response_format request parameter for "text", "json" (JSON mode), or "structured" output."""
+        if mode == "json":
+            return {"type": "json_object"}
+        if mode == "structured":
+            return {
+                "type": "json_schema",
+                "json_schema": {"name": "invasion_biology_extraction", "strict": True, "schema": self.json_schema()},
+            }
+        return None
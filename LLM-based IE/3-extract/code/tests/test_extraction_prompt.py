@@ -0,0 +1,24 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import extraction_prompt
+from extraction_prompt import PROMPT_CACHE_MIN_TOKENS, USER_PROMPTS, build_messages, count_tokens, get_system_prompt
+
+def test_system_prompt_is_long_enough_for_prompt_caching():
+    prompt = get_system_prompt()
+    assert count_tokens(prompt) >= PROMPT_CACHE_MIN_TOKENS
+    if extraction_prompt.tiktoken is None:
+        # Without tiktoken, tokens are estimated at 4 characters each; English text and indented JSON take
+        # fewer characters per token than that, so the prompt must reach the minimum even at 5 characters per token
+        assert len(prompt) >= 5 * PROMPT_CACHE_MIN_TOKENS
+
+def test_every_input_type_shares_the_system_prompt():
+    fields = {"title": "A title", "abstract": "An abstract", "full_text": "A text"}
+    prompts = {build_messages(input_type, **fields)[0]["content"] for input_type in USER_PROMPTS}
+    assert prompts == {get_system_prompt()}
+
+def test_user_messages_only_carry_the_paper():
+    messages = build_messages(title="A title", abstract="An abstract")
+    assert messages[1]["content"] == "Title: A title\nAbstract: An abstract"
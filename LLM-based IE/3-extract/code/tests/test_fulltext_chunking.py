@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from extraction_prompt import count_tokens
+from fulltext_chunking import chunk_full_text, split_sections
+
+# A full text as stored by scripts/ask-doi-list-fulltext-search.py, whose clean_text replaces line breaks with spaces
+FLATTENED = (
+    "Invasive plant spread in coastal wetlands  Abstract Invasive plants spread fast. "
+    "1. Introduction Biological invasions threaten wetlands (Smith 2001). "
+    "2. Materials and methods We sampled 40 plots. Results show no change in the controls. "
+    "Results Cover of Ludwigia peploides increased. Discussion Our findings matter. "
+    "Acknowledgements We thank the rangers of the park. "
+    "References Smith, J. (2001). Invasions. Methods Ecol. Evol. 3: 1-10. Jones, K. (2005). Wetlands."
+)
+
+def test_split_sections_finds_headings_in_flattened_text():
+    headings = [heading for heading, _ in split_sections(FLATTENED)]
+    assert headings == ["", "Abstract", "1. Introduction", "2. Materials and methods", "Results", "Discussion",
+                        "Acknowledgements", "References"]
+
+def test_section_names_inside_sentences_and_references_are_not_headings():
+    sections = dict(split_sections(FLATTENED))
+    assert sections["2. Materials and methods"] == "We sampled 40 plots. Results show no change in the controls."
+    assert "Methods Ecol. Evol." in sections["References"]
+
+def test_chunks_of_flattened_text_drop_back_matter():
+    text = " ".join(chunk_full_text(FLATTENED))
+    assert "Ludwigia peploides" in text
+    assert "rangers" not in text
+    assert "Smith, J." not in text
+
+def test_headings_on_their_own_lines():
+    text = "Title\n\nIntroduction\nInvasions matter.\n\nReferences\nSmith, J. (2001)."
+    assert split_sections(text) == [("", "Title"), ("Introduction", "Invasions matter."), ("References", "Smith, J. (2001).")]
+
+def test_body_heading_ends_false_positive_back_matter_early_in_the_text():
+    text = FLATTENED.replace("threaten wetlands (Smith 2001). ",
+                             "threaten wetlands (Smith 2001). Funding Agencies rarely support such surveys. ")
+    chunks = " ".join(chunk_full_text(text))
+    assert "We sampled 40 plots." in chunks
+    assert "Ludwigia peploides" in chunks
+    assert "Smith, J." not in chunks
+
+def test_oversized_sentence_is_split_within_the_token_budget():
+    table = " ".join(f"cell{number}" for number in range(400))
+    chunks = chunk_full_text(f"Results\n{table}", max_tokens=50)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+    assert " ".join(chunk.replace("Results\n\n", "") for chunk in chunks) == table
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from work_queue import DEAD, FAILED, WorkQueue
+
+def test_reextracted_doi_is_not_dead_lettered_on_a_transient_error(tmp_path):
+    with WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=3) as queue:
+        for _ in range(4):
+            queue.start("10.1/a", "10.1_a")
+            queue.finish("10.1_a")
+        queue.start("10.1/a", "10.1_a")
+        assert queue.fail("10.1_a", "APIConnectionError", "connection reset") == FAILED
+
+def test_consecutive_failures_are_dead_lettered(tmp_path):
+    with WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=3, base_backoff=0) as queue:
+        states = []
+        for _ in range(3):
+            queue.start("10.1/a", "10.1_a")
+            states.append(queue.fail("10.1_a", "APIConnectionError", "connection reset"))
+        assert states == [FAILED, FAILED, DEAD]
+
+def test_permanent_errors_are_dead_lettered_at_once(tmp_path):
+    with WorkQueue(str(tmp_path / "queue.sqlite")) as queue:
+        queue.start("10.1/a", "10.1_a")
+        assert queue.fail("10.1_a", "BadRequestError", "context length exceeded") == DEAD
@@ -0,0 +1,147 @@
+import random
+import sqlite3
+import threading
+import time
+
+# States of a DOI in the queue
+PENDING, IN_FLIGHT, DONE, NA, FAILED, DEAD = "pending", "in_flight", "done", "na", "failed", "dead"
+
+# Errors that will not go away by retrying the same request, e.g. a prompt over the context window,
+# or a DOI that is no longer in the input
+PERMANENT_ERRORS = {"BadRequestError", "UnprocessableEntityError", "MissingFromInput"}
+
+class WorkQueue:
+    """Persistent record of every DOI's extraction state, kept in a SQLite file next to the outputs.
+
+    Failed DOIs are retried with exponential backoff; a DOI that keeps failing, or fails with a
+    permanent error, is moved to the dead-letter state and is only retried on request.
+    """
+
+    def __init__(self, path, max_attempts=5, base_backoff=60.0, max_backoff=3600.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                doi_cleaned TEXT PRIMARY KEY,
+                doi TEXT,
+                state TEXT,
+                attempts INTEGER DEFAULT 0,
+                error_class TEXT,
+                error_message TEXT,
+                next_attempt_at REAL DEFAULT 0,
+                updated_at REAL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state, next_attempt_at)")
+        # Requests that were running when a previous run stopped never finished
+        self.connection.execute("UPDATE items SET state = ? WHERE state = ?", (PENDING, IN_FLIGHT))
+        self.connection.commit()
+
+    def _execute(self, query, parameters=()):
+        with self.lock:
+            cursor = self.connection.execute(query, parameters)
+            self.connection.commit()
+            return cursor
+
+    def waiting_state(self, doi_cleaned):
+        """Return FAILED if a DOI failed and its backoff has not elapsed, DEAD if it was dead-lettered, and None otherwise.
+
+        Done and N/A DOIs are not waiting: whether they are extracted again is up to the caller,
+        e.g. when their output was removed or a re-extraction was asked for.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT state, next_attempt_at FROM items WHERE doi_cleaned = ?", (doi_cleaned,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[0] == DEAD or (row[0] == FAILED and row[1] > time.time()):
+            return row[0]
+        return None
+
+    def start(self, doi, doi_cleaned):
+        """Mark a DOI as in flight and count the attempt."""
+        self._execute("""
+            INSERT INTO items (doi_cleaned, doi, state, attempts, updated_at) VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (doi_cleaned) DO UPDATE SET state = excluded.state, attempts = attempts + 1,
+                updated_at = excluded.updated_at
+        """, (doi_cleaned, doi, IN_FLIGHT, time.time()))
+
+    def finish(self, doi_cleaned, na=False):
+        """Mark a DOI as extracted, or as not relevant to invasion biology.
+
+        The attempt count is reset, so that only consecutive failures count towards dead-lettering
+        when the DOI is extracted again later.
+        """
+        self._execute("""
+            UPDATE items SET state = ?, attempts = 0, error_class = NULL, error_message = NULL, next_attempt_at = 0,
+                updated_at = ? WHERE doi_cleaned = ?
+        """, (NA if na else DONE, time.time(), doi_cleaned))
+
+    def fail(self, doi_cleaned, error_class, error_message):
+        """Record a failed attempt and schedule the next one with jittered exponential backoff,
+        or move the DOI to the dead-letter state if it should not be retried."""
+        with self.lock:
+            row = self.connection.execute("SELECT attempts FROM items WHERE doi_cleaned = ?", (doi_cleaned,)).fetchone()
+        attempts = row[0] if row else 1
+        if attempts >= self.max_attempts or error_class in PERMANENT_ERRORS:
+            state, next_attempt_at = DEAD, 0
+        else:
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+            state, next_attempt_at = FAILED, time.time() + random.uniform(delay / 2, delay)
+        self._execute("""
+            UPDATE items SET state = ?, error_class = ?, error_message = ?, next_attempt_at = ?, updated_at = ?
+            WHERE doi_cleaned = ?
+        """, (state, error_class, str(error_message)[:1000], next_attempt_at, time.time(), doi_cleaned))
+        return state
+
+    def due_failures(self):
+        """Return the failed DOIs whose backoff has elapsed."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT doi_cleaned FROM items WHERE state = ? AND next_attempt_at <= ?", (FAILED, time.time())
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def seconds_until_next_retry(self):
+        """Return how long until the next failed DOI is due, or None if no DOI is waiting for a retry."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT MIN(next_attempt_at) FROM items WHERE state = ?", (FAILED,)
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def revive_dead(self):
+        """Give dead-lettered DOIs a fresh set of attempts, due immediately."""
+        return self._execute(
+            "UPDATE items SET state = ?, attempts = 0, next_attempt_at = 0, updated_at = ? WHERE state = ?",
+            (FAILED, time.time(), DEAD),
+        ).rowcount
+
+    def print_summary(self):
+        """Print the number of DOIs in each state, and the most common errors of failed and dead DOIs."""
+        with self.lock:
+            counts = dict(self.connection.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+            errors = self.connection.execute("""
+                SELECT state, error_class, COUNT(*) FROM items WHERE state IN (?, ?)
+                GROUP BY state, error_class ORDER BY COUNT(*) DESC LIMIT 10
+            """, (FAILED, DEAD)).fetchall()
+        print(f"Work queue ({self.path}): " + ", ".join(
+            f"{state} {counts.get(state, 0)}" for state in (PENDING, IN_FLIGHT, DONE, NA, FAILED, DEAD)))
+        for state, error_class, count in errors:
+            print(f"  {state}: {count} x {error_class}")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
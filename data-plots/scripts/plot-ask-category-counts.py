@@ -1,9 +1,16 @@
 import pandas as pd
 
+# Function to read only the DOI, Abstract and Full-text columns of the ASK corpus (CSV or memory-mapped Parquet)
+def read_ask_publications(ask_file):
+    columns = ['DOI', 'Abstract', 'Full-text']
+    if ask_file.lower().endswith(('.parquet', '.pq')):
+        return pd.read_parquet(ask_file, columns=columns, memory_map=True)
+    return pd.read_csv(ask_file, usecols=columns)
+
 def count_publications_by_category(crossref_file, ask_file, output_file, category_column):
     # Read the CSV files
     crossref_data = pd.read_csv(crossref_file)
-    ask_data = pd.read_csv(ask_file)
+    ask_data = read_ask_publications(ask_file)
     
     # Filter the crossref metadata based on matching DOIs from the ask publications data
     matched_data = crossref_data[crossref_data['DOI'].isin(ask_data['DOI'])]
@@ -46,7 +53,7 @@ def count_publications_by_category(crossref_file, ask_file, output_file, categor
 
 # Take file paths and category input from the user
 crossref_file_path = input("Enter the path for the Crossref metadata file: ")
-ask_file_path = input("Enter the path for the ASK publications file: ")
+ask_file_path = input("Enter the path for the ASK publications file (CSV or Parquet): ")
 output_file_path = input("Enter the output file name (e.g., publication_counts_by_category.csv): ")
 category_column = input("Enter the column name to count publications by (e.g., Publisher): ")
 
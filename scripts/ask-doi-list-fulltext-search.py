@@ -1,38 +1,70 @@
 import requests
 import json
-import pandas as pd
 import csv
 import time
 import os
+import random
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from doi_index import iter_dois, normalize_doi, ProcessedDOIIndex
+from rate_limiter import TokenBucket
+from response_cache import default_cache, cache_key, CacheMiss
+from corpus_store import csv_to_parquet
+
+# One HTTP session per worker thread so connections are reused across requests
+thread_local = threading.local()
+
+def get_session():
+    if not hasattr(thread_local, 'session'):
+        thread_local.session = requests.Session()
+    return thread_local.session
+
+# Function to build the cache key of the explore response for a single DOI, so that DOI URLs and
+# doi: prefixes share the entry of the bare DOI
+def explore_cache_key(doi):
+    return cache_key('ask-explore', normalize_doi(doi))
+
+# Function to tell whether a result is an offline cache miss, which is neither retried nor logged as processed
+def is_cache_miss(result):
+    return result is not None and result.get('error') == 'CacheMiss'
+
+# Function to build the explore URL for a single DOI
+def explore_url(doi):
+    return f"https://api.ask.orkg.org/index/explore?filter=doi%20IN%20[%22{doi}%22]"
+
+# Function to turn an explore response for a single DOI into an output row, or None if nothing was found
+def result_from_response(data):
+    # Access the items
+    items = data['payload'].get('items', [])
+
+    # If no items are found
+    if not items:
+        return None
+
+    # Only process the first item if there are multiple (to avoid duplicates)
+    return process_item(items[0])
 
 # Function to make the GET request and fetch data from the API using the provided DOI
-def fetch_orkg_data_by_doi(doi, retry_count=1, max_retries=2, backoff_time=12):
-    url = f"https://api.ask.orkg.org/index/explore?filter=doi%20IN%20[%22{doi}%22]"
+def fetch_orkg_data_by_doi(doi, retry_count=1, max_retries=2, backoff_time=12, session=None, before_request=None):
+    url = explore_url(doi)
 
     try:
-        response = requests.get(url)
+        # Responses are served from the local cache when available
+        response = default_cache().get(url, key=explore_cache_key(doi), session=session, before_request=before_request)
         response.raise_for_status()  # Raise exception for HTTP errors
 
         # Parse the JSON response
-        data = response.json()
-
-        # Access the total number of hits and the items
-        total_hits = data['payload'].get('total_hits', 0)
-        items = data['payload'].get('items', [])
-
-        # If no items are found
-        if not items:
-            return None
-        
-        # Only process the first item if there are multiple (to avoid duplicates)
-        return process_item(items[0])
+        return result_from_response(response.json())
 
+    except CacheMiss as miss:
+        return {'error': 'CacheMiss', 'message': str(miss)}
     except requests.exceptions.HTTPError as http_err:
         if response.status_code in [404, 422]:
             error_type = "404 Client Error" if response.status_code == 404 else "422 Validation Error"
             if retry_count < max_retries:
                 time.sleep(backoff_time)  # Backoff before retrying
-                return fetch_orkg_data_by_doi(doi, retry_count + 1)  # Retry with the same DOI
+                return fetch_orkg_data_by_doi(doi, retry_count + 1, max_retries, backoff_time, session, before_request)  # Retry with the same DOI
             else:
                 return {'error': error_type, 'message': str(http_err)}
         else:
@@ -40,6 +72,97 @@ def fetch_orkg_data_by_doi(doi, retry_count=1, max_retries=2, backoff_time=12):
     except Exception as err:
         return {'error': 'GeneralError', 'message': str(err)}
 
+# Function to fetch several DOIs with a single explore request, following pagination through total_hits.
+# DOIs already in the cache are answered locally, and each fetched DOI is cached on its own so that
+# later single or batched lookups can reuse it
+def fetch_orkg_data_by_dois(dois, session=None, page_size=100, before_request=None):
+    cache = default_cache()
+    results = {}
+    for doi in dois:
+        cached = cache.lookup(explore_cache_key(doi))
+        if cached is not None:
+            results[doi] = result_from_response(cached.json())
+
+    missing = [doi for doi in dois if doi not in results]
+    if not missing:
+        return results
+
+    doi_list = ', '.join(f'"{doi}"' for doi in missing)
+    params = {'filter': f'doi IN [{doi_list}]', 'limit': page_size, 'offset': 0}
+    wanted = {normalize_doi(doi): doi for doi in missing}
+    items_by_doi = {}
+
+    try:
+        if cache.offline:
+            raise CacheMiss(f"Offline mode: {len(missing)} DOIs are not cached")
+
+        while True:
+            if before_request:
+                before_request()
+            response = (session or requests).get("https://api.ask.orkg.org/index/explore", params=params)
+            response.raise_for_status()  # Raise exception for HTTP errors
+
+            # Access the total number of hits and the items of this page
+            payload = response.json()['payload']
+            total_hits = payload.get('total_hits', 0)
+            items = payload.get('items', [])
+
+            for item in items:
+                doi = wanted.get(normalize_doi(item.get('doi', '')))
+                # Only keep the first item per DOI (to avoid duplicates)
+                if doi is not None and doi not in items_by_doi:
+                    items_by_doi[doi] = item
+
+            params['offset'] += len(items)
+            if not items or params['offset'] >= total_hits:
+                break
+
+    except CacheMiss as miss:
+        error = {'error': 'CacheMiss', 'message': str(miss)}
+        return {**results, **{doi: error for doi in missing}}
+    except requests.exceptions.HTTPError as http_err:
+        error = {'error': 'HTTPError', 'message': str(http_err)}
+        return {**results, **{doi: error for doi in missing}}
+    except Exception as err:
+        error = {'error': 'GeneralError', 'message': str(err)}
+        return {**results, **{doi: error for doi in missing}}
+
+    for doi in missing:
+        # DOIs without a matching item were not found (cached as an empty result)
+        items = [items_by_doi[doi]] if doi in items_by_doi else []
+        data = {'payload': {'total_hits': len(items), 'items': items}}
+        cache.put(explore_cache_key(doi), explore_url(doi), json.dumps(data).encode('utf-8'))
+        results[doi] = result_from_response(data)
+    return results
+
+# Function to fetch a DOI with its own jittered exponential backoff (used by the concurrent mode)
+def fetch_with_backoff(doi, rate_limiter, max_retries=4, base_backoff=1.0, max_backoff=60.0):
+    session = get_session()
+    for attempt in range(max_retries + 1):
+        # max_retries=1 disables the blocking retry inside fetch_orkg_data_by_doi; cache hits skip the rate limiter
+        result = fetch_orkg_data_by_doi(doi, max_retries=1, session=session, before_request=rate_limiter.acquire)
+        if result is None or 'error' not in result or is_cache_miss(result) or attempt == max_retries:
+            return result
+        # Only this worker sleeps, so other DOIs keep flowing while this one backs off
+        delay = min(max_backoff, base_backoff * (2 ** attempt))
+        time.sleep(random.uniform(delay / 2, delay))
+    return result
+
+# Function to fetch a batch of DOIs with backoff, falling back to single-DOI requests if the batch keeps failing
+def fetch_batch_with_backoff(dois, rate_limiter, max_retries=4, base_backoff=1.0, max_backoff=60.0):
+    session = get_session()
+    for attempt in range(max_retries + 1):
+        results = fetch_orkg_data_by_dois(dois, session=session, before_request=rate_limiter.acquire)
+        # Offline cache misses will not be answered by retrying, so only other errors are retried
+        if not any(result is not None and 'error' in result and not is_cache_miss(result) for result in results.values()):
+            return results
+        if attempt < max_retries:
+            delay = min(max_backoff, base_backoff * (2 ** attempt))
+            time.sleep(random.uniform(delay / 2, delay))
+
+    # A single malformed DOI can reject the whole filter, so isolate it
+    return {doi: fetch_with_backoff(doi, rate_limiter, max_retries, base_backoff, max_backoff) for doi in dois}
+
 # Function to process each item from the API response and return a formatted row
 def process_item(item):
     # Extract relevant fields
@@ -61,79 +184,141 @@ def clean_text(text):
         return text.replace('\n', ' ').replace('\r', ' ').strip()
     return 'N/A'
 
-# Function to log DOIs that were not found
-def log_not_found(doi, not_found_file):
-    with open(not_found_file, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([doi])
-
-# Function to log DOIs with errors
-def log_error(doi, error_details, error_file):
-    with open(error_file, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([doi, error_details.get('error', 'UnknownError'), error_details.get('message', 'No message')])
-
-# Function to log processed DOIs
-def log_processed(doi, processed_file):
-    with open(processed_file, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([doi])
-
-# Function to read already processed DOIs from the log file
-def load_processed_dois(processed_file):
-    if os.path.exists(processed_file):
-        with open(processed_file, mode='r', newline='', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            return set(row[0] for row in reader)  # Return set of processed DOIs
-    return set()  # If file does not exist, return an empty set
+# Checkpoint log that keeps the output CSV and the not-found, error and processed logs open,
+# and commits them together so that the processed log never gets ahead of the output
+class CheckpointLog:
+    def __init__(self, output_file_path, not_found_file, error_file, processed_file, checkpoint_every=100):
+        self.paths = {
+            'output': output_file_path,
+            'not_found': not_found_file,
+            'error': error_file,
+            'processed': processed_file,
+        }
+        self.checkpoint_file = f"{processed_file}.checkpoint"
+        self.checkpoint_every = checkpoint_every
+        self.pending = 0
 
-# Function to read DOIs from the CSV file, fetch data for each DOI, and write the output to another CSV
-def process_dois_from_csv(input_file_path, output_file_path, not_found_file, error_file, processed_file):
-    try:
-        # Load already processed DOIs
-        processed_dois = load_processed_dois(processed_file)
+        # Drop anything written after the last commit before a crash, then reopen for appending
+        self.restore()
+        self.files = {name: open(path, mode='a', newline='', encoding='utf-8') for name, path in self.paths.items()}
+        self.writers = {name: csv.writer(file) for name, file in self.files.items()}
+        self.writers['output'] = csv.writer(self.files['output'], quoting=csv.QUOTE_ALL)  # Quote all fields to preserve commas
 
-        # Read the CSV file
-        df = pd.read_csv(input_file_path)
+        # Write the header row only when starting a new output file
+        if self.files['output'].tell() == 0:
+            self.writers['output'].writerow(['ASK ID', 'DOI', 'Title', 'Abstract', 'Full-text'])
+            self.commit()
 
-        # Check if the DOI column exists (case insensitive)
-        if 'DOI' in df.columns:
-            doi_column = 'DOI'
-        elif 'doi' in df.columns:
-            doi_column = 'doi'
-        else:
-            print("No DOI column found in the CSV file.")
+    # Truncate every file back to its size at the last committed checkpoint
+    def restore(self):
+        if not os.path.exists(self.checkpoint_file):
             return
+        with open(self.checkpoint_file, mode='r', encoding='utf-8') as file:
+            sizes = json.load(file)
+        for name, path in self.paths.items():
+            if name in sizes and os.path.exists(path) and os.path.getsize(path) > sizes[name]:
+                print(f"Discarding uncommitted records in {path}")
+                os.truncate(path, sizes[name])
+
+    # Buffer the outcome of a single DOI and commit at batch boundaries
+    def record(self, doi, result):
+        if is_cache_miss(result):
+            # Not recorded as processed, so the DOI is fetched once the script runs online again
+            print(f"Not cached: {doi}")
+            return
+        if result is None:
+            # Log DOIs not found
+            self.writers['not_found'].writerow([doi])
+        elif 'error' in result:
+            # Log DOIs with errors
+            self.writers['error'].writerow([doi, result.get('error', 'UnknownError'), result.get('message', 'No message')])
+        else:
+            # Write the processed data to the output CSV
+            self.writers['output'].writerow(result)
+
+        # Log the DOI as processed
+        self.writers['processed'].writerow([doi])
+
+        self.pending += 1
+        if self.pending >= self.checkpoint_every:
+            self.commit()
 
-        # Open the output CSV file for writing
-        with open(output_file_path, mode='w', newline='', encoding='utf-8') as output_file:
-            csv_writer = csv.writer(output_file, quoting=csv.QUOTE_ALL)  # Quote all fields to preserve commas
+    # Flush and fsync all files, then atomically record their sizes as the new checkpoint
+    def commit(self):
+        sizes = {}
+        for name, file in self.files.items():
+            file.flush()
+            os.fsync(file.fileno())
+            sizes[name] = os.fstat(file.fileno()).st_size
 
-            # Write the header row
-            csv_writer.writerow(['ASK ID', 'DOI', 'Title', 'Abstract', 'Full-text'])
+        temp_file = f"{self.checkpoint_file}.tmp"
+        with open(temp_file, mode='w', encoding='utf-8') as file:
+            json.dump(sizes, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.checkpoint_file)
+        self.pending = 0
 
-            # Iterate through the DOIs and fetch data for each
-            for i, doi in enumerate(df[doi_column].dropna(), start=1):
-                if doi in processed_dois:
-                    continue  # Skip already processed DOIs
+    def close(self):
+        self.commit()
+        for file in self.files.values():
+            file.close()
 
-                result = fetch_orkg_data_by_doi(doi)
+    def __enter__(self):
+        return self
 
-                if result is None:
-                    # Log DOIs not found
-                    log_not_found(doi, not_found_file)
-                elif 'error' in result:
-                    # Log DOIs with errors
-                    log_error(doi, result, error_file)
-                else:
-                    # Write the processed data to the output CSV
-                    csv_writer.writerow(result)
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-                # Log the DOI as processed
-                log_processed(doi, processed_file)
-                
-                # Rate limiting: sleep for 0.1 seconds to ensure no more than 10 queries per second
-                time.sleep(0.1)
+# Function to fetch the results of one task (a single DOI or a batch of DOIs) as a DOI-to-result dictionary
+def fetch_task(dois, rate_limiter):
+    if len(dois) == 1:
+        return {dois[0]: fetch_with_backoff(dois[0], rate_limiter)}
+    return fetch_batch_with_backoff(dois, rate_limiter)
+
+# Function to fetch DOIs with a bounded number of requests in flight under a shared rate limit
+def fetch_dois_concurrently(dois, workers, requests_per_second, batch_size=1):
+    rate_limiter = TokenBucket(requests_per_second)
+    max_in_flight = workers * 2  # Keep the pool busy without queueing the whole input
+    in_flight = set()
+    dois = iter(dois)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while batch := list(islice(dois, batch_size)):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result().items()
+            in_flight.add(executor.submit(fetch_task, batch, rate_limiter))
+
+        for future in in_flight:
+            yield from future.result().items()
+
+# Function to fetch DOIs one at a time
+def fetch_dois_sequentially(dois, requests_per_second=10):
+    # Rate limiting: no more than 10 queries per second (cache hits do not count)
+    rate_limiter = TokenBucket(requests_per_second, capacity=1)
+    for doi in dois:
+        yield doi, fetch_orkg_data_by_doi(doi, before_request=rate_limiter.acquire)
+
+# Function to read DOIs from the CSV file, fetch data for each DOI, and write the output to another CSV
+def process_dois_from_csv(input_file_path, output_file_path, not_found_file, error_file, processed_file, workers=1, requests_per_second=10, batch_size=1, checkpoint_every=100, parquet_file_path=None):
+    try:
+        # Open the output CSV and the logs, appending to them when resuming, then index the already
+        # processed DOIs on disk instead of loading them into a set
+        with CheckpointLog(output_file_path, not_found_file, error_file, processed_file, checkpoint_every) as checkpoint, \
+                ProcessedDOIIndex(processed_file) as processed_dois:
+            # Stream the DOIs from the CSV file, skipping already processed ones
+            pending_dois = (doi for doi in iter_dois(input_file_path) if doi not in processed_dois)
+
+            if workers > 1 or batch_size > 1:
+                results = fetch_dois_concurrently(pending_dois, workers, requests_per_second, batch_size)
+            else:
+                results = fetch_dois_sequentially(pending_dois, requests_per_second)
+
+            # Results are written from the main thread only, so the writers need no locking
+            for i, (doi, result) in enumerate(results, start=1):
+                checkpoint.record(doi, result)
 
                 # Print progress every 100 DOIs processed
                 if i % 100 == 0:
@@ -141,6 +326,11 @@ def process_dois_from_csv(input_file_path, output_file_path, not_found_file, err
 
         print(f"\nData successfully written to {output_file_path}")
 
+        # Optionally keep a columnar copy of the corpus for downstream readers
+        if parquet_file_path:
+            count = csv_to_parquet(output_file_path, parquet_file_path)
+            print(f"{count} records written to {parquet_file_path}")
+
     except FileNotFoundError:
         print(f"File not found: {input_file_path}")
     except Exception as e:
@@ -154,5 +344,10 @@ if __name__ == "__main__":
     not_found_file = input("Please enter the path to the CSV file to log DOIs not found in ASK: ")
     error_file = input("Please enter the path to the CSV file to log errors: ")
     processed_file = input("Please enter the path to the CSV file to log processed DOIs: ")
+    workers = input("Please enter the number of concurrent requests (press Enter for 1): ").strip()
+    workers = int(workers) if workers else 1
+    batch_size = input("Please enter the number of DOIs per explore request (press Enter for 1): ").strip()
+    batch_size = int(batch_size) if batch_size else 1
+    parquet_file_path = input("Please enter the path to a Parquet copy of the output (press Enter to skip): ").strip()
     
-    process_dois_from_csv(input_file_path, output_file_path, not_found_file, error_file, processed_file)
+    process_dois_from_csv(input_file_path, output_file_path, not_found_file, error_file, processed_file, workers=workers, batch_size=batch_size, parquet_file_path=parquet_file_path or None)
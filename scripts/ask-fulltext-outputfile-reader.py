@@ -1,9 +1,11 @@
-import csv
-import sys
 import statistics
+import numpy as np
+from corpus_store import iter_corpus_rows, iter_corpus_frames, TOKEN_COLUMNS  # Raises the CSV field size limit for full texts
 
-# Set a reasonable large limit for CSV field size
-csv.field_size_limit(10**7)  # Setting limit to 10 million characters
+# Categories of rows by text availability, and histogram bin edges for token lengths
+CATEGORIES = ["no text", "abstract only", "full-text only", "both"]
+LENGTH_BINS = [10, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, np.inf]
+PERCENTILES = [5, 25, 50, 75, 95, 99]
 
 # Function to count tokens by splitting text on spaces
 def count_tokens(text):
@@ -19,61 +21,149 @@ def read_csv_and_process(file_path):
     abstract_lengths = []
     full_text_lengths = []
     
-    with open(file_path, mode='r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
+    # Read only the needed columns from the CSV or Parquet corpus
+    for row in iter_corpus_rows(file_path, columns=["DOI", "Abstract", "Full-text"]):
+        total_rows += 1
+        doi = row["DOI"]
+        abstract = row["Abstract"]
+        full_text = row["Full-text"]
+
+        print(f"Processing row {total_rows}: DOI = {doi}")
+        
+        abstract_token_count = count_tokens(abstract)
+        full_text_token_count = count_tokens(full_text)
         
-        for row in reader:
-            total_rows += 1
-            doi = row["DOI"]
-            abstract = row["Abstract"]
-            full_text = row["Full-text"]
-
-            print(f"Processing row {total_rows}: DOI = {doi}")
-            
-            abstract_token_count = count_tokens(abstract)
-            full_text_token_count = count_tokens(full_text)
-            
-            has_abstract = abstract != "N/A" and abstract_token_count >= 10
-            has_fulltext = full_text != "N/A" and full_text_token_count >= 10
-            
-            if not has_abstract and not has_fulltext:
-                no_abstract_no_fulltext += 1
-                print("No abstract and no full-text available")
-            elif has_abstract and not has_fulltext:
-                abstract_no_fulltext += 1
-                abstract_lengths.append(abstract_token_count)
-                print(f"Abstract token length: {abstract_token_count}")
-                print("No full-text available")
-            elif has_abstract and has_fulltext:
-                both_abstract_and_fulltext += 1
-                abstract_lengths.append(abstract_token_count)
-                full_text_lengths.append(full_text_token_count)
-                print(f"Abstract token length: {abstract_token_count}")
-                print(f"Full-text token length: {full_text_token_count}")
-            elif has_abstract:
-                abstract_lengths.append(abstract_token_count)
+        has_abstract = abstract != "N/A" and abstract_token_count >= 10
+        has_fulltext = full_text != "N/A" and full_text_token_count >= 10
         
-        # Print total rows count
-        print(f"\nTotal DOIs (rows) processed: {total_rows}")
-        print(f"Rows with no abstracts and no full-text: {no_abstract_no_fulltext}")
-        print(f"Rows with abstracts but no full-text: {abstract_no_fulltext}")
-        print(f"Rows with both abstracts and full-text: {both_abstract_and_fulltext}")
-
-        # Compute and print statistics for abstract lengths for all rows with abstracts
-        if abstract_lengths:
-            print(f"\nAbstract Length Statistics (for all rows with abstracts):")
-            print(f"Min Abstract Length: {min(abstract_lengths)}")
-            print(f"Max Abstract Length: {max(abstract_lengths)}")
-            print(f"Avg Abstract Length: {statistics.mean(abstract_lengths)}")
-
-        # Compute and print statistics for full-text lengths where both abstract and full-text are present
-        if full_text_lengths:
-            print(f"\nFull-text Length Statistics (only where full-text is present):")
-            print(f"Min Full-text Length: {min(full_text_lengths)}")
-            print(f"Max Full-text Length: {max(full_text_lengths)}")
-            print(f"Avg Full-text Length: {statistics.mean(full_text_lengths)}")
+        if not has_abstract and not has_fulltext:
+            no_abstract_no_fulltext += 1
+            print("No abstract and no full-text available")
+        elif has_abstract and not has_fulltext:
+            abstract_no_fulltext += 1
+            abstract_lengths.append(abstract_token_count)
+            print(f"Abstract token length: {abstract_token_count}")
+            print("No full-text available")
+        elif has_abstract and has_fulltext:
+            both_abstract_and_fulltext += 1
+            abstract_lengths.append(abstract_token_count)
+            full_text_lengths.append(full_text_token_count)
+            print(f"Abstract token length: {abstract_token_count}")
+            print(f"Full-text token length: {full_text_token_count}")
+        elif has_abstract:
+            abstract_lengths.append(abstract_token_count)
+    
+    # Print total rows count
+    print(f"\nTotal DOIs (rows) processed: {total_rows}")
+    print(f"Rows with no abstracts and no full-text: {no_abstract_no_fulltext}")
+    print(f"Rows with abstracts but no full-text: {abstract_no_fulltext}")
+    print(f"Rows with both abstracts and full-text: {both_abstract_and_fulltext}")
+
+    # Compute and print statistics for abstract lengths for all rows with abstracts
+    if abstract_lengths:
+        print(f"\nAbstract Length Statistics (for all rows with abstracts):")
+        print(f"Min Abstract Length: {min(abstract_lengths)}")
+        print(f"Max Abstract Length: {max(abstract_lengths)}")
+        print(f"Avg Abstract Length: {statistics.mean(abstract_lengths)}")
+
+    # Compute and print statistics for full-text lengths where both abstract and full-text are present
+    if full_text_lengths:
+        print(f"\nFull-text Length Statistics (only where full-text is present):")
+        print(f"Min Full-text Length: {min(full_text_lengths)}")
+        print(f"Max Full-text Length: {max(full_text_lengths)}")
+        print(f"Avg Full-text Length: {statistics.mean(full_text_lengths)}")
+
+# Function to count tokens for a whole column at once, reusing stored token counts when the corpus has them
+def column_token_counts(frame, column):
+    token_column = TOKEN_COLUMNS[column]
+    if token_column in frame.columns:
+        return frame[token_column].to_numpy(dtype=np.int64)
+    return frame[column].str.count(r"\S+").to_numpy(dtype=np.int64)
+
+# Function to summarize an array of token lengths
+def summarize_lengths(lengths):
+    if len(lengths) == 0:
+        return {"count": 0}
+    histogram, _ = np.histogram(lengths, bins=LENGTH_BINS)
+    return {
+        "count": int(len(lengths)),
+        "min": int(lengths.min()),
+        "max": int(lengths.max()),
+        "mean": float(lengths.mean()),
+        "percentiles": {p: float(v) for p, v in zip(PERCENTILES, np.percentile(lengths, PERCENTILES))},
+        "histogram": [(int(low), float(high), int(count)) for low, high, count in zip(LENGTH_BINS[:-1], LENGTH_BINS[1:], histogram)],
+    }
+
+# Function to compute corpus statistics in chunks, with token counts computed per column rather than per row
+def compute_corpus_statistics(file_path, chunksize=5000):
+    category_counts = dict.fromkeys(CATEGORIES, 0)
+    abstract_lengths = {category: [] for category in CATEGORIES}
+    full_text_lengths = {category: [] for category in CATEGORIES}
+    total_rows = 0
+
+    for frame in iter_corpus_frames(file_path, ["DOI", "Abstract", "Full-text"] + list(TOKEN_COLUMNS.values()), chunksize):
+        abstract = frame["Abstract"].fillna("N/A")
+        full_text = frame["Full-text"].fillna("N/A")
+        abstract_tokens = column_token_counts(frame, "Abstract")
+        full_text_tokens = column_token_counts(frame, "Full-text")
+
+        # Same thresholds as the per-row report: text must be present and have at least 10 tokens
+        has_abstract = (abstract != "N/A").to_numpy() & (abstract_tokens >= 10)
+        has_fulltext = (full_text != "N/A").to_numpy() & (full_text_tokens >= 10)
+        masks = {
+            "no text": ~has_abstract & ~has_fulltext,
+            "abstract only": has_abstract & ~has_fulltext,
+            "full-text only": ~has_abstract & has_fulltext,
+            "both": has_abstract & has_fulltext,
+        }
+
+        total_rows += len(frame)
+        for category, mask in masks.items():
+            category_counts[category] += int(mask.sum())
+            abstract_lengths[category].append(abstract_tokens[mask & has_abstract])
+            full_text_lengths[category].append(full_text_tokens[mask & has_fulltext])
+
+    def concatenate(parts):
+        return np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+
+    abstract_lengths = {category: concatenate(parts) for category, parts in abstract_lengths.items()}
+    full_text_lengths = {category: concatenate(parts) for category, parts in full_text_lengths.items()}
+    return {
+        "total_rows": total_rows,
+        "category_counts": category_counts,
+        "abstract": {category: summarize_lengths(lengths) for category, lengths in abstract_lengths.items()},
+        "full_text": {category: summarize_lengths(lengths) for category, lengths in full_text_lengths.items()},
+        "all_abstracts": summarize_lengths(concatenate(list(abstract_lengths.values()))),
+        "all_full_texts": summarize_lengths(concatenate(list(full_text_lengths.values()))),
+    }
+
+# Function to print one length summary
+def print_length_summary(label, summary):
+    if summary["count"] == 0:
+        return
+    print(f"\n{label} ({summary['count']} rows):")
+    print(f"Min: {summary['min']}  Max: {summary['max']}  Avg: {summary['mean']:.2f}")
+    print("Percentiles: " + ", ".join(f"p{p}={v:.0f}" for p, v in summary["percentiles"].items()))
+    for low, high, count in summary["histogram"]:
+        print(f"  [{low}, {high:g}): {count}")
+
+# Function to print the statistics computed by compute_corpus_statistics
+def print_corpus_statistics(stats):
+    print(f"Total DOIs (rows) processed: {stats['total_rows']}")
+    for category, count in stats["category_counts"].items():
+        print(f"Rows with {category}: {count}")
+
+    print_length_summary("Abstract Length Statistics (for all rows with abstracts)", stats["all_abstracts"])
+    print_length_summary("Full-text Length Statistics (for all rows with full-text)", stats["all_full_texts"])
+    for category in CATEGORIES:
+        print_length_summary(f"Abstract Length Statistics ({category})", stats["abstract"][category])
+        print_length_summary(f"Full-text Length Statistics ({category})", stats["full_text"][category])
 
 # Get the input file path from the user
-file_path = input("Please enter the path to the CSV file: ")
+file_path = input("Please enter the path to the CSV or Parquet file: ")
+mode = input("Enter 'stats' for summary statistics only, or press Enter for the per-row report: ").strip().lower()
 
-read_csv_and_process(file_path)
+if mode == "stats":
+    print_corpus_statistics(compute_corpus_statistics(file_path))
+else:
+    read_csv_and_process(file_path)
@@ -1,54 +1,22 @@
-import os
-import json
-import csv
-from collections import Counter
+from corpus_insights import compile_insights, unique_values, write_counts
 
 def count_location_tuples():
     # Get input directory and output file names from the user
-    json_dir = input("Enter the directory containing JSON files: ").strip()
+    json_dir = input("Enter the extraction output folder or store file: ").strip()
     output_csv = input("Enter the output CSV file name: ").strip()
+    normalize = input("Count canonical entity names instead of the raw strings? (y/N): ").strip().lower() == "y"
 
-    # Initialize a counter for (location_name, geopolitical_info) tuples
-    location_counter = Counter()
-    geopolitical_info_set = set()
-
-    # Iterate through all JSON files in the directory
-    for filename in os.listdir(json_dir):
-        if filename.endswith('.json'):
-            filepath = os.path.join(json_dir, filename)
-            
-            # Read the JSON file
-            with open(filepath, 'r', encoding='utf-8') as file:
-                try:
-                    data = json.load(file)
-                except json.JSONDecodeError:
-                    print(f"Skipping invalid JSON file: {filename}")
-                    continue
-
-                # Extract location data and count the tuples
-                if "location" in data:
-                    for location in data["location"]:
-                        location_name = location.get("name")
-                        geopolitical_info = location.get("properties", {}).get("geopolitical_info")
-
-                        if location_name and geopolitical_info:
-                            location_counter[(location_name, geopolitical_info)] += 1
-                            geopolitical_info_set.add(geopolitical_info)
-
-    # Write the counts to a CSV file
-    with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
-        writer.writerow(["Location Name", "Geopolitical Info", "Count"])
-
-        for (location_name, geopolitical_info), count in location_counter.items():
-            writer.writerow([location_name, geopolitical_info, count])
+    # Count (location_name, geopolitical_info) tuples and write them to a CSV file
+    location_counter = compile_insights(json_dir, ['locations'], normalize=normalize)['locations']
+    write_counts('locations', location_counter, output_csv)
 
     # Print all unique Geopolitical Info tags
     print("Unique Geopolitical Info tags:")
-    for tag in sorted(geopolitical_info_set):
+    for tag in unique_values(location_counter):
         print(tag)
 
     print(f"Counts written to {output_csv}")
 
-# Run the function
-count_location_tuples()
\ No newline at end of file
+# Run the function; worker processes re-import this script, so it only runs when started directly
+if __name__ == "__main__":
+    count_location_tuples()
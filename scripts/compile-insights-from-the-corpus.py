@@ -0,0 +1,23 @@
+import time
+
+from corpus_insights import ANALYSES, compile_insights, update_insights, write_all
+
+# Run all five analyses (species roles, locations, ecosystems, habitats, and relations) in one pass over the extractions
+if __name__ == "__main__":
+    input_path = input("Enter the extraction output folder or store file: ").strip()
+    output_folder = input("Enter the folder for the output CSV files: ").strip()
+    workers = int(input("Enter the number of worker processes (default: one per CPU core): ").strip() or 0) or None
+    state_path = input("Enter a state file to update the counts of an earlier run incrementally "
+                       "(leave empty to count everything again): ").strip()
+    # Species, location, ecosystem, and habitat names are resolved through the alias index set in ENTITY_ALIAS_INDEX
+    normalize = input("Count canonical entity names instead of the raw strings? (y/N): ").strip().lower() == "y"
+
+    start_time = time.time()
+    if state_path:
+        counters, stats = update_insights(input_path, state_path, tuple(ANALYSES), workers, normalize)
+        print(f"Extractions added: {stats['added']}, changed: {stats['changed']}, removed: {stats['removed']}")
+    else:
+        counters = compile_insights(input_path, tuple(ANALYSES), workers, normalize)
+    for path in write_all(counters, output_folder):
+        print(f"Written {path}")
+    print(f"All analyses compiled in {time.time() - start_time:.1f}s")
@@ -0,0 +1,281 @@
+import csv
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from entity_normalization import default_normalizer
+from extraction_store import iter_extractions, open_extraction_store
+
+# Output CSV of each analysis, as in LLM-based IE/3-extract/analysis, with its header and quoting
+ANALYSES = {
+    'species': ('species-role-counts.csv', ["Species Name", "Role", "Count"], csv.QUOTE_MINIMAL),
+    'locations': ('location-geoinfo-counts.csv', ["Location Name", "Geopolitical Info", "Count"], csv.QUOTE_ALL),
+    'ecosystems': ('ecosystems-type-counts.csv', ["Ecosystem Name", "Type", "Count"], csv.QUOTE_MINIMAL),
+    'habitats': ('habitats-type-counts.csv', ["Habitat Name", "Type", "Ecosystem Type", "Count"], csv.QUOTE_MINIMAL),
+    'relations': ('relations-type-counts.csv', ["Relationship Name", "Type", "Count"], csv.QUOTE_MINIMAL),
+}
+
+# Lists of the unique values of one column of an analysis, written alongside the CSVs
+UNIQUE_VALUES = {
+    'species': ('unique-roles-observed.txt', 1),
+    'relations': ('unique-relation-types-observed.txt', 1),
+}
+
+# Functions counting one extraction into the counter of one analysis. The names, defaults, and case
+# handling are those of the original compile-insights-from-the-corpus-*.py scripts. Given a canonical
+# function (e.g. EntityNormalizer.canonical), entity names are counted under their canonical names instead
+def _canonical_name(canonical, kind, name):
+    if canonical is None or not isinstance(name, str):
+        return name
+    return canonical(kind, name) or name
+
+def count_species(data, counter, canonical=None):
+    if "species" in data:
+        for species in data["species"]:
+            species_name = species.get("name", "Unknown")
+            species_name = species_name.lower() if canonical is None else _canonical_name(canonical, 'species', species_name)
+            role = species.get("properties", {}).get("role", "Unknown").lower()
+            counter[(species_name, role)] += 1
+
+def count_locations(data, counter, canonical=None):
+    if "location" in data:
+        for location in data["location"]:
+            location_name = location.get("name")
+            geopolitical_info = location.get("properties", {}).get("geopolitical_info")
+            if location_name and geopolitical_info:
+                location_name = _canonical_name(canonical, 'location', location_name)
+                counter[(location_name, geopolitical_info)] += 1
+
+def count_ecosystems(data, counter, canonical=None):
+    if "ecosystem" in data:
+        for ecosystem in data["ecosystem"]:
+            ecosystem_name = _canonical_name(canonical, 'ecosystem', ecosystem.get("name", "Unknown"))
+            ecosystem_type = ecosystem.get("properties", {}).get("type", "Unknown")
+            counter[(ecosystem_name, ecosystem_type)] += 1
+
+def count_habitats(data, counter, canonical=None):
+    habitats = data.get("habitat", [])
+    if isinstance(habitats, list):
+        for habitat in habitats:
+            if isinstance(habitat, dict):
+                name = _canonical_name(canonical, 'habitat', habitat.get("name", "unknown"))
+                habitat_type = habitat.get("properties", {}).get("type", "unknown")
+                # The ecosystem a habitat is part of is named like an ecosystem
+                ecosystem_type = _canonical_name(canonical, 'ecosystem',
+                                                 habitat.get("properties", {}).get("subcomponent_of", "unknown"))
+                counter[(name, habitat_type, ecosystem_type)] += 1
+
+def count_relations(data, counter, canonical=None):
+    for relationship in data.get('relationships', []):
+        properties = relationship.get('relationship_properties', {})
+        counter[(properties.get('name', 'unknown'), properties.get('type', 'unknown'))] += 1
+
+COUNTERS = {
+    'species': count_species,
+    'locations': count_locations,
+    'ecosystems': count_ecosystems,
+    'habitats': count_habitats,
+    'relations': count_relations,
+}
+
+def new_counters(analyses=tuple(ANALYSES)):
+    return {name: Counter() for name in analyses}
+
+# Function to count one parsed extraction into the counters of all requested analyses
+def count_extraction(data, counters, canonical=None):
+    for name, counter in counters.items():
+        COUNTERS[name](data, counter, canonical)
+
+# Function to add partial counts into running counts. Keys new to a counter are appended in the order of the
+# partial counts, so merging the partials of contiguous shards in shard order keeps first-occurrence order
+def merge_counters(counters, partial):
+    for name, counter in partial.items():
+        counters[name].update(counter)
+    return counters
+
+# Store and canonicalizer set up once in each worker process, so the offset index of a store and the alias
+# index are not reloaded for every shard
+_worker_store = None
+_worker_canonical = None
+
+def _canonical_function(normalize):
+    return default_normalizer().canonical if normalize else None
+
+def _open_worker_store(path, normalize=False):
+    global _worker_store, _worker_canonical
+    _worker_store = open_extraction_store(path)
+    _worker_canonical = _canonical_function(normalize)
+
+def _count_shard(analyses, shard):
+    counters = new_counters(analyses)
+    for record in _worker_store.iter_records(shard):
+        if isinstance(record['data'], dict):
+            count_extraction(record['data'], counters, _worker_canonical)
+    return counters
+
+# Function to run the requested analyses over an extraction output folder or store in a single pass,
+# parsing each extraction once. Returns a Counter of tuples per analysis, in order of first occurrence.
+# With more than one worker, contiguous shards of the extractions are counted in a process pool and the
+# partial counts are merged in shard order, which gives the same counts in the same order as a serial pass.
+# With normalize, entity names are counted under their canonical names (see entity_normalization.py)
+def compile_insights(path, analyses=tuple(ANALYSES), workers=None, normalize=False):
+    analyses = tuple(analyses)
+    workers = workers or os.cpu_count() or 1
+    counters = new_counters(analyses)
+    shards = []
+    if workers > 1:
+        with open_extraction_store(path) as store:
+            # A few shards per worker even out shards that take longer to parse
+            shards = store.shards(workers * 4)
+    if len(shards) <= 1:
+        canonical = _canonical_function(normalize)
+        for data in iter_extractions(path):
+            count_extraction(data, counters, canonical)
+        return counters
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_store, initargs=(path, normalize)) as executor:
+        for partial in executor.map(_count_shard, repeat(analyses), shards):
+            merge_counters(counters, partial)
+    return counters
+
+# Version of the incremental state file; states of another version are discarded and rebuilt
+STATE_VERSION = 1
+
+# Function to hash the content of an extraction independently of its layout, so that a record that only moved
+# (e.g. by compacting a store) or a file that was only touched is not counted again
+def content_hash(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# Function to count what one extraction contributes to each analysis, as JSON-ready [*key, count] rows
+def contribution(data, analyses, canonical=None):
+    counters = new_counters(analyses)
+    if isinstance(data, dict):
+        count_extraction(data, counters, canonical)
+    return {name: [[*key, count] for key, count in counter.items()] for name, counter in counters.items() if counter}
+
+def _apply(counters, rows, sign):
+    for name, name_rows in rows.items():
+        counter = counters[name]
+        for row in name_rows:
+            key = tuple(row[:-1])
+            counter[key] += sign * row[-1]
+            if counter[key] <= 0:
+                del counter[key]
+
+def _contributions_of_keys(analyses, keys, store=None, canonical=None):
+    if store is None:
+        store, canonical = _worker_store, _worker_canonical
+    results = []
+    for key in keys:
+        record = store.get(key)
+        data = record['data'] if record else None
+        results.append((key, content_hash(data), contribution(data, analyses, canonical)))
+    return results
+
+def _load_state(state_path, analyses, normalization):
+    try:
+        with open(state_path, 'r', encoding='utf-8') as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return None
+    if (state.get('version') != STATE_VERSION or state.get('analyses') != list(analyses)
+            or state.get('normalization') != normalization):
+        return None
+    return state
+
+def _save_state(state_path, state):
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as state_file:
+        # json.dumps runs in the C encoder, unlike json.dump into a file
+        state_file.write(json.dumps(state, ensure_ascii=False, separators=(',', ':')))
+    os.replace(temp_path, state_path)
+
+# Function to bring the counts of an earlier run up to date with the extractions added, changed, or removed since.
+# The state file keeps the counts plus a manifest with the version, content hash, and contribution of every
+# extraction, so only extractions whose version changed are parsed, and their old contribution is subtracted
+# from the counts before the new one is added. Rows of new keys are appended after the existing rows, and rows
+# whose count drops to zero are removed. The state is rebuilt from scratch when the normalization rules or alias
+# index differ from those it was counted with. Returns the counters and the number of added, changed, and
+# removed extractions
+def update_insights(path, state_path, analyses=tuple(ANALYSES), workers=None, normalize=False):
+    analyses = tuple(analyses)
+    workers = workers or os.cpu_count() or 1
+    normalizer = default_normalizer() if normalize else None
+    normalization = normalizer.fingerprint() if normalizer else None
+    state = _load_state(state_path, analyses, normalization) or {
+        'version': STATE_VERSION, 'analyses': list(analyses), 'normalization': normalization, 'manifest': {},
+        'counts': {name: [] for name in analyses},
+    }
+    manifest = state['manifest']
+    counters = {name: Counter({tuple(row[:-1]): row[-1] for row in state['counts'][name]}) for name in analyses}
+    stats = {'added': 0, 'changed': 0, 'removed': 0}
+
+    with open_extraction_store(path) as store:
+        versions = store.versions()
+        for key in sorted(manifest.keys() - versions.keys()):
+            _apply(counters, manifest.pop(key)['contribution'], -1)
+            stats['removed'] += 1
+
+        # Sorting by version follows the order of a full pass: file order in a store, file name order in a folder
+        pending = sorted((key for key, version in versions.items()
+                          if manifest.get(key, {}).get('version') != list(version)), key=lambda key: versions[key])
+        if workers > 1 and len(pending) > 1000:
+            size = -(-len(pending) // (workers * 4))
+            batches = [pending[start:start + size] for start in range(0, len(pending), size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_store,
+                                     initargs=(path, normalize)) as executor:
+                results = [result for batch in executor.map(_contributions_of_keys, repeat(analyses), batches)
+                           for result in batch]
+        else:
+            results = _contributions_of_keys(analyses, pending, store, normalizer.canonical if normalizer else None)
+
+    if not (stats['removed'] or results):
+        return counters, stats
+    for key, sha1, rows in results:
+        entry = manifest.get(key)
+        if entry is not None and entry['sha1'] == sha1:
+            entry['version'] = list(versions[key])
+            continue
+        if entry is not None:
+            _apply(counters, entry['contribution'], -1)
+            stats['changed'] += 1
+        else:
+            stats['added'] += 1
+        _apply(counters, rows, 1)
+        manifest[key] = {'version': list(versions[key]), 'sha1': sha1, 'contribution': rows}
+
+    state['counts'] = {name: [[*key, count] for key, count in counter.items()] for name, counter in counters.items()}
+    _save_state(state_path, state)
+    return counters, stats
+
+# Function to list the sorted unique values of one column of an analysis, e.g. the observed species roles
+def unique_values(counter, position=1):
+    return sorted({key[position] for key in counter})
+
+# Function to write the counts of one analysis as a CSV in the format of the original script
+def write_counts(name, counter, output_csv):
+    _, header, quoting = ANALYSES[name]
+    with open(output_csv, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file, quoting=quoting)
+        writer.writerow(header)
+        for key, count in counter.items():
+            writer.writerow([*key, count])
+
+# Function to write every analysis, plus the lists of unique roles and relation types, into an output folder
+def write_all(counters, output_folder):
+    os.makedirs(output_folder, exist_ok=True)
+    written = []
+    for name, counter in counters.items():
+        output_csv = os.path.join(output_folder, ANALYSES[name][0])
+        write_counts(name, counter, output_csv)
+        written.append(output_csv)
+        if name in UNIQUE_VALUES:
+            filename, position = UNIQUE_VALUES[name]
+            output_txt = os.path.join(output_folder, filename)
+            with open(output_txt, 'w', encoding='utf-8') as txt_file:
+                txt_file.writelines(f"{value}\n" for value in unique_values(counter, position))
+            written.append(output_txt)
+    return written
@@ -0,0 +1,136 @@
+import csv
+import os
+import sys
+
+# pyarrow is only needed for Parquet corpus files; CSV corpora work without it
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Allow the very long full-text fields of the CSV corpus
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+# Text columns written by ask-doi-list-fulltext-search.py, plus the token counts stored alongside them
+TEXT_COLUMNS = ['ASK ID', 'DOI', 'Title', 'Abstract', 'Full-text']
+TOKEN_COLUMNS = {'Abstract': 'Abstract Tokens', 'Full-text': 'Full-text Tokens'}
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for Parquet corpus files (pip install pyarrow)")
+
+# Function to tell Parquet corpus files apart from CSV ones
+def is_parquet(path):
+    return path.lower().endswith(('.parquet', '.pq'))
+
+# Function to count whitespace-separated tokens, treating missing text as empty
+def count_tokens(text):
+    if not text or text == 'N/A':
+        return 0
+    return len(text.split())
+
+# Function to build the Arrow schema of the corpus: typed text columns plus int32 token counts
+def corpus_schema():
+    require_pyarrow()
+    fields = [pa.field(name, pa.string()) for name in TEXT_COLUMNS]
+    fields += [pa.field(name, pa.int32()) for name in TOKEN_COLUMNS.values()]
+    return pa.schema(fields)
+
+# Writer that appends corpus rows to a Parquet file in row groups, computing token counts on the way
+class ParquetCorpusWriter:
+    def __init__(self, path, row_group_size=1000):
+        self.schema = corpus_schema()
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    # Add a row given as a list in TEXT_COLUMNS order or as a dictionary keyed by column name
+    def write_row(self, row):
+        if not isinstance(row, dict):
+            row = dict(zip(TEXT_COLUMNS, row))
+        record = {name: row.get(name) for name in TEXT_COLUMNS}
+        for text_column, token_column in TOKEN_COLUMNS.items():
+            record[token_column] = count_tokens(record[text_column])
+        self.rows.append(record)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Function to convert a CSV corpus into a Parquet corpus without loading it all into memory
+def csv_to_parquet(csv_path, parquet_path, row_group_size=1000):
+    count = 0
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as file, \
+            ParquetCorpusWriter(parquet_path, row_group_size) as writer:
+        for row in csv.DictReader(file):
+            writer.write_row(row)
+            count += 1
+    return count
+
+# Function to list the columns available in a CSV or Parquet corpus
+def corpus_columns(path):
+    if is_parquet(path):
+        require_pyarrow()
+        return pq.read_schema(path).names
+    with open(path, mode='r', newline='', encoding='utf-8') as file:
+        return next(csv.reader(file), [])
+
+# Function to stream the rows of a CSV or Parquet corpus as dictionaries, reading only the requested columns.
+# Parquet files are memory-mapped and read one row group at a time
+def iter_corpus_rows(path, columns=None, batch_size=1000):
+    if is_parquet(path):
+        require_pyarrow()
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield from batch.to_pylist()
+        return
+
+    with open(path, mode='r', newline='', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield row if columns is None else {name: row.get(name) for name in columns}
+
+# Function to stream a CSV or Parquet corpus as pandas DataFrames of at most chunksize rows,
+# reading only the requested columns
+def iter_corpus_frames(path, columns=None, chunksize=5000):
+    import pandas as pd
+
+    if is_parquet(path):
+        require_pyarrow()
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        available = [name for name in columns if name in parquet_file.schema_arrow.names] if columns else None
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=available):
+            yield batch.to_pandas()
+        return
+
+    available = [name for name in columns if name in corpus_columns(path)] if columns else None
+    yield from pd.read_csv(path, usecols=available, dtype=str, keep_default_na=False, chunksize=chunksize)
+
+# Function to read selected columns of a Parquet corpus into a memory-mapped Arrow table
+def read_corpus_table(path, columns=None):
+    require_pyarrow()
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+if __name__ == "__main__":
+    # Convert a CSV corpus written by the ASK fetcher into Parquet
+    csv_path = input("Please enter the path to the corpus CSV file: ").strip()
+    parquet_path = input("Please enter the path to the output Parquet file: ").strip()
+    if not os.path.exists(csv_path):
+        print(f"File not found: {csv_path}")
+    else:
+        print(f"{csv_to_parquet(csv_path, parquet_path)} records written to {parquet_path}")
@@ -0,0 +1,145 @@
+import csv
+import heapq
+import mmap
+import os
+import sys
+import tempfile
+
+# Allow very long fields in DOI logs and corpus CSVs
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+# Prefixes that resolve a DOI, which are not part of the DOI itself
+DOI_PREFIXES = ('https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/', 'http://dx.doi.org/', 'doi:')
+
+# Sorted copies of a processed-DOI log are kept next to it with this suffix, which changes whenever
+# normalize_doi does, so that copies sorted under an older normalization are rebuilt
+SORTED_SUFFIX = ".sorted-v2"
+
+# Function to normalize a DOI so that lookups ignore case, surrounding whitespace, and a resolver prefix
+def normalize_doi(doi):
+    doi = str(doi).strip().lower()
+    for prefix in DOI_PREFIXES:
+        if doi.startswith(prefix):
+            return doi[len(prefix):]
+    return doi
+
+# Function to stream DOIs from a CSV file one row at a time instead of loading it with pandas
+def iter_dois(csv_path, columns=('DOI', 'doi')):
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+
+        column = next((header.index(name) for name in columns if name in header), None)
+        if column is None:
+            # Files such as queried_DOIs.csv are a bare list of DOIs without a header
+            if header and header[0].strip().startswith('10.'):
+                column = 0
+                reader = _prepend(header, reader)
+            else:
+                raise ValueError(f"No DOI column ({', '.join(columns)}) found in {csv_path}")
+
+        for row in reader:
+            if len(row) > column and row[column].strip():
+                yield row[column].strip()
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+# Function to write the normalized, de-duplicated DOIs of a log file into a sorted file with bounded memory
+def build_sorted_index(source_path, target_path, chunk_size=500000):
+    directory = os.path.dirname(os.path.abspath(target_path))
+    chunk_paths = []
+    try:
+        with open(source_path, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            chunk = set()
+            for row in reader:
+                if row and row[0].strip():
+                    chunk.add(normalize_doi(row[0]))
+                if len(chunk) >= chunk_size:
+                    chunk_paths.append(_write_chunk(chunk, directory))
+                    chunk = set()
+            if chunk:
+                chunk_paths.append(_write_chunk(chunk, directory))
+
+        # Merge the sorted chunks, keeping one copy of each DOI
+        chunk_files = [open(path, mode='rb') for path in chunk_paths]
+        temp_path = f"{target_path}.tmp"
+        try:
+            with open(temp_path, mode='wb') as output:
+                previous = None
+                for line in heapq.merge(*chunk_files):
+                    if line != previous:
+                        output.write(line)
+                        previous = line
+        finally:
+            for chunk_file in chunk_files:
+                chunk_file.close()
+        os.replace(temp_path, target_path)
+    finally:
+        for path in chunk_paths:
+            os.remove(path)
+
+def _write_chunk(dois, directory):
+    fd, path = tempfile.mkstemp(suffix='.doi-chunk', dir=directory)
+    with os.fdopen(fd, mode='wb') as file:
+        # Sorting UTF-8 bytes gives the same order as sorting the strings
+        for doi in sorted(doi.encode('utf-8') for doi in dois):
+            file.write(doi + b'\n')
+    return path
+
+# Index over a processed-DOI log that is probed by binary search on a sorted, memory-mapped file,
+# so membership checks do not need the whole log in memory
+class ProcessedDOIIndex:
+    def __init__(self, processed_file):
+        self.index_file = f"{processed_file}{SORTED_SUFFIX}"
+        self.file = None
+        self.map = None
+
+        if not os.path.exists(processed_file):
+            return
+
+        # Rebuild the sorted copy whenever the log has been appended to since it was built
+        if not os.path.exists(self.index_file) or os.path.getmtime(self.index_file) < os.path.getmtime(processed_file):
+            build_sorted_index(processed_file, self.index_file)
+
+        if os.path.getsize(self.index_file) > 0:
+            self.file = open(self.index_file, mode='rb')
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, doi):
+        if self.map is None:
+            return False
+
+        key = normalize_doi(doi).encode('utf-8')
+        low, high = 0, len(self.map)
+        while low < high:
+            middle = (low + high) // 2
+            # Widen the probe to the whole line around the middle byte
+            start = self.map.rfind(b'\n', 0, middle) + 1
+            end = self.map.find(b'\n', middle)
+            if end == -1:
+                end = len(self.map)
+            line = self.map[start:end]
+            if line == key:
+                return True
+            if line < key:
+                low = end + 1
+            else:
+                high = start
+        return False
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
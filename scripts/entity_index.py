@@ -0,0 +1,417 @@
+import json
+import os
+import re
+import time
+
+from corpus_insights import content_hash
+from entity_normalization import default_normalizer, normalize_text
+from extraction_store import open_extraction_store
+
+# Version of the index files; an index of another version, or built with other normalization, is rebuilt
+INDEX_VERSION = 1
+MANIFEST_FILE = "index.json"
+# Segments are merged into one, dropping removed extractions from their postings, once there are more than this
+MAX_SEGMENTS = 8
+
+# Facets of the index and the entity kind whose normalization applies to their values (None for property values).
+# species_role holds "species|role" values, so that a species and its role are matched within one mention
+FACETS = {
+    'species': 'species',
+    'role': None,
+    'species_role': 'species',
+    'location': 'location',
+    'geopolitical_info': None,
+    'ecosystem': 'ecosystem',
+    'ecosystem_type': None,
+    'habitat': 'habitat',
+    'habitat_type': None,
+    'relation': None,
+    'relation_type': None,
+}
+
+# Function to normalize the value of a facet into the value stored in the index
+def facet_value(facet, value, canonical=None):
+    if facet == 'species_role':
+        name, _, role = str(value).rpartition('|')
+        return f"{facet_value('species', name, canonical)}|{normalize_text(role)}"
+    kind = FACETS[facet]
+    if canonical is not None and kind is not None:
+        return canonical(kind, str(value)) or normalize_text(value)
+    return normalize_text(value)
+
+def _properties(entity):
+    properties = entity.get('properties')
+    return properties if isinstance(properties, dict) else {}
+
+# Function to list the (facet, value) terms of one extraction
+def extraction_terms(data, canonical=None):
+    terms = set()
+
+    def add(facet, value):
+        if isinstance(value, str) and value.strip():
+            terms.add((facet, facet_value(facet, value, canonical)))
+
+    for species in data.get('species') or []:
+        if isinstance(species, dict):
+            add('species', species.get('name'))
+            add('role', _properties(species).get('role'))
+            if isinstance(species.get('name'), str) and isinstance(_properties(species).get('role'), str):
+                add('species_role', f"{species['name']}|{_properties(species)['role']}")
+    for location in data.get('location') or []:
+        if isinstance(location, dict):
+            add('location', location.get('name'))
+            add('geopolitical_info', _properties(location).get('geopolitical_info'))
+    for ecosystem in data.get('ecosystem') or []:
+        if isinstance(ecosystem, dict):
+            add('ecosystem', ecosystem.get('name'))
+            add('ecosystem_type', _properties(ecosystem).get('type'))
+    for habitat in data.get('habitat') or []:
+        if isinstance(habitat, dict):
+            add('habitat', habitat.get('name'))
+            add('habitat_type', _properties(habitat).get('type'))
+    for relationship in data.get('relationships') or []:
+        if isinstance(relationship, dict):
+            properties = relationship.get('relationship_properties') or {}
+            add('relation', properties.get('name'))
+            add('relation_type', properties.get('type'))
+    return terms
+
+# Posting lists are sorted document ids, stored as the varint-encoded gaps between consecutive ids
+def encode_postings(ids):
+    encoded = bytearray()
+    previous = -1
+    for doc_id in ids:
+        gap = doc_id - previous
+        previous = doc_id
+        while gap >= 0x80:
+            encoded.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        encoded.append(gap)
+    return bytes(encoded)
+
+def decode_postings(encoded):
+    ids = []
+    previous, gap, shift = -1, 0, 0
+    for byte in encoded:
+        gap |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            previous += gap
+            ids.append(previous)
+            gap, shift = 0, 0
+    return ids
+
+# One immutable segment of the index: a .postings file of concatenated posting lists and a .terms.json file
+# mapping "facet:value" to the (offset, length, count) of its posting list. Extractions get increasing ids as
+# they are indexed, so the ids of a segment all follow those of earlier segments
+class Segment:
+    def __init__(self, index_folder, name):
+        self.name = name
+        self.postings_path = os.path.join(index_folder, f"{name}.postings")
+        with open(os.path.join(index_folder, f"{name}.terms.json"), 'r', encoding='utf-8') as file:
+            self.terms = json.load(file)
+
+    def postings(self, term):
+        if term not in self.terms:
+            return []
+        offset, length, _ = self.terms[term]
+        with open(self.postings_path, 'rb') as file:
+            file.seek(offset)
+            return decode_postings(file.read(length))
+
+    @staticmethod
+    def write(index_folder, name, postings):
+        terms = {}
+        with open(os.path.join(index_folder, f"{name}.postings"), 'wb') as file:
+            offset = 0
+            for term in sorted(postings):
+                encoded = encode_postings(postings[term])
+                file.write(encoded)
+                terms[term] = (offset, len(encoded), len(postings[term]))
+                offset += len(encoded)
+        with open(os.path.join(index_folder, f"{name}.terms.json"), 'w', encoding='utf-8') as file:
+            file.write(json.dumps(terms, ensure_ascii=False, separators=(',', ':')))
+
+def _term_key(facet, value):
+    return f"{facet}:{value}"
+
+# On-disk inverted index from the entity and property values of the extractions to the extractions mentioning
+# them. The manifest (index.json) lists the segments, the DOI of every document id, and the version and content
+# hash of every indexed extraction. Removed or rewritten extractions are tombstoned by clearing their document
+# entry, and left out of query results until the segments are merged
+class EntityIndex:
+    def __init__(self, index_folder):
+        self.index_folder = index_folder
+        self.manifest = self._load_manifest()
+        self.segments = [Segment(index_folder, name) for name in self.manifest['segments']]
+        self.canonical = default_normalizer().canonical if self.manifest['normalization'] is not None else None
+
+    def _load_manifest(self):
+        with open(os.path.join(self.index_folder, MANIFEST_FILE), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('version') != INDEX_VERSION:
+            raise ValueError(f"{self.index_folder} holds an index of version {manifest.get('version')}; rebuild it")
+        return manifest
+
+    def __len__(self):
+        return sum(document is not None for document in self.manifest['documents'])
+
+    # Return the sorted ids of the live documents mentioning a value of a facet
+    def postings(self, facet, value):
+        if facet not in FACETS:
+            raise ValueError(f"Unknown facet '{facet}'; expected one of {', '.join(FACETS)}")
+        term = _term_key(facet, facet_value(facet, value, self.canonical))
+        documents = self.manifest['documents']
+        return [doc_id for segment in self.segments for doc_id in segment.postings(term) if documents[doc_id] is not None]
+
+    # Return the sorted ids of the documents matching a query such as
+    # species:"asterias amurensis" AND role:invasive AND (ecosystem_type:marine OR ecosystem_type:coastal)
+    def search(self, query):
+        return sorted(QueryParser(query).parse().evaluate(self))
+
+    def document(self, doc_id):
+        return self.manifest['documents'][doc_id]
+
+    # Return the most frequent values of a facet with the number of extractions they were indexed for
+    def values(self, facet, limit=30):
+        counts = {}
+        prefix = f"{facet}:"
+        for segment in self.segments:
+            for term, (_, _, count) in segment.terms.items():
+                if term.startswith(prefix):
+                    counts[term[len(prefix):]] = counts.get(term[len(prefix):], 0) + count
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+# Nodes of a parsed query, evaluated into sets of document ids
+class Term:
+    def __init__(self, facet, value):
+        self.facet, self.value = facet, value
+
+    def evaluate(self, index):
+        return set(index.postings(self.facet, self.value))
+
+class And:
+    def __init__(self, operands):
+        self.operands = operands
+
+    def evaluate(self, index):
+        result = None
+        # Intersecting from the smallest set keeps every intermediate result small
+        for ids in sorted((operand.evaluate(index) for operand in self.operands), key=len):
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return result or set()
+
+class Or:
+    def __init__(self, operands):
+        self.operands = operands
+
+    def evaluate(self, index):
+        return set().union(*(operand.evaluate(index) for operand in self.operands))
+
+QUERY_TOKEN = re.compile(r'\s*(?:(?P<paren>[()])|(?P<operator>AND|OR)(?=[\s()]|$)'
+                         r'|(?P<facet>\w+):(?:"(?P<quoted>[^"]*)"|(?P<bare>[^\s()"]+)))')
+
+# Recursive-descent parser of queries: terms facet:value or facet:"value with spaces", combined with AND and OR
+# (AND binds tighter, and is implied between adjacent terms) and grouped with parentheses
+class QueryParser:
+    def __init__(self, query):
+        self.query = query
+        self.tokens = self._tokenize(query)
+        self.position = 0
+
+    def _tokenize(self, query):
+        tokens = []
+        position = 0
+        while query[position:].strip():
+            match = QUERY_TOKEN.match(query, position)
+            if match is None:
+                raise ValueError(f"Cannot parse the query at: {query[position:].strip()}")
+            if match.group('paren'):
+                tokens.append((match.group('paren'), None))
+            elif match.group('operator'):
+                tokens.append((match.group('operator'), None))
+            else:
+                value = match.group('quoted') if match.group('quoted') is not None else match.group('bare')
+                tokens.append(('term', Term(match.group('facet'), value)))
+            position = match.end()
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def parse(self):
+        node = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"Unexpected '{self._peek()}' in the query: {self.query}")
+        return node
+
+    def _or(self):
+        operands = [self._and()]
+        while self._peek() == 'OR':
+            self.position += 1
+            operands.append(self._and())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def _and(self):
+        operands = [self._atom()]
+        while self._peek() in ('AND', 'term', '('):
+            if self._peek() == 'AND':
+                self.position += 1
+            operands.append(self._atom())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def _atom(self):
+        kind = self._peek()
+        if kind == 'term':
+            self.position += 1
+            return self.tokens[self.position - 1][1]
+        if kind == '(':
+            self.position += 1
+            node = self._or()
+            if self._peek() != ')':
+                raise ValueError(f"Missing ')' in the query: {self.query}")
+            self.position += 1
+            return node
+        raise ValueError(f"Expected a term or '(' but found {kind or 'the end'} in the query: {self.query}")
+
+def _new_manifest(normalization):
+    return {'version': INDEX_VERSION, 'normalization': normalization, 'segments': [], 'next_segment': 0,
+            'documents': [], 'extractions': {}}
+
+def _remove_segment_files(index_folder, name):
+    for suffix in ('.postings', '.terms.json'):
+        path = os.path.join(index_folder, f"{name}{suffix}")
+        if os.path.exists(path):
+            os.remove(path)
+
+# Function to bring the index of an extraction output folder or store up to date. Only extractions whose version
+# (see the store's versions()) changed since the last update are read: new ones are indexed into a new segment,
+# and the document ids of removed or rewritten ones are tombstoned. Once there are more than MAX_SEGMENTS
+# segments, or with merge, all segments are merged into one without the tombstoned ids. The index is rebuilt from
+# scratch when the normalization rules or alias index differ from those it was built with. Returns the number of
+# added, changed, and removed extractions
+def update_index(extractions_path, index_folder, normalize=False, merge=False):
+    os.makedirs(index_folder, exist_ok=True)
+    normalizer = default_normalizer() if normalize else None
+    normalization = normalizer.fingerprint() if normalizer else None
+    canonical = normalizer.canonical if normalizer else None
+    manifest_path = os.path.join(index_folder, MANIFEST_FILE)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest is None or manifest.get('version') != INDEX_VERSION or manifest.get('normalization') != normalization:
+        for name in (manifest or {}).get('segments', []):
+            _remove_segment_files(index_folder, name)
+        manifest = _new_manifest(normalization)
+    documents, extractions = manifest['documents'], manifest['extractions']
+    stats = {'added': 0, 'changed': 0, 'removed': 0}
+
+    postings = {}
+    with open_extraction_store(extractions_path) as store:
+        versions = store.versions()
+        for key in sorted(extractions.keys() - versions.keys()):
+            doc_id = extractions.pop(key)['id']
+            if doc_id is not None:
+                documents[doc_id] = None
+            stats['removed'] += 1
+
+        # Sorting by version follows the order of a full pass: file order in a store, file name order in a folder
+        pending = sorted((key for key, version in versions.items()
+                          if extractions.get(key, {}).get('version') != list(version)), key=lambda key: versions[key])
+        for key in pending:
+            record = store.get(key)
+            data = record['data'] if record else None
+            sha1 = content_hash(data)
+            entry = extractions.get(key)
+            if entry is not None and entry['sha1'] == sha1:
+                entry['version'] = list(versions[key])
+                continue
+            if entry is not None:
+                if entry['id'] is not None:
+                    documents[entry['id']] = None
+                stats['changed'] += 1
+            else:
+                stats['added'] += 1
+            doc_id = None
+            # N/A answers are recorded so they are not read again, but mention nothing
+            if isinstance(data, dict):
+                doc_id = len(documents)
+                documents.append(record.get('doi') or key)
+                for facet, value in extraction_terms(data, canonical):
+                    postings.setdefault(_term_key(facet, value), []).append(doc_id)
+            extractions[key] = {'version': list(versions[key]), 'sha1': sha1, 'id': doc_id}
+
+    if postings:
+        name = f"segment-{manifest['next_segment']:06d}"
+        Segment.write(index_folder, name, postings)
+        manifest['segments'].append(name)
+        manifest['next_segment'] += 1
+    removed_segments = []
+    if len(manifest['segments']) > MAX_SEGMENTS or (merge and len(manifest['segments']) > 0):
+        removed_segments = manifest['segments']
+        merged = {}
+        # Segments hold increasing ids, so concatenating their postings in order keeps every list sorted
+        for segment in (Segment(index_folder, name) for name in removed_segments):
+            for term in segment.terms:
+                live = [doc_id for doc_id in segment.postings(term) if documents[doc_id] is not None]
+                if live:
+                    merged.setdefault(term, []).extend(live)
+        name = f"segment-{manifest['next_segment']:06d}"
+        Segment.write(index_folder, name, merged)
+        manifest['segments'] = [name]
+        manifest['next_segment'] += 1
+
+    if pending or stats['removed'] or removed_segments:
+        # The manifest is replaced last, so an interrupted update leaves the previous index intact
+        temp_path = f"{manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(manifest, ensure_ascii=False, separators=(',', ':')))
+        os.replace(temp_path, manifest_path)
+    for name in removed_segments:
+        _remove_segment_files(index_folder, name)
+    return stats
+
+if __name__ == "__main__":
+    print("Modes:")
+    print("  1. Build or update the index of an extraction output folder or store")
+    print("  2. Search the index")
+    print("  3. List the most frequent values of a facet")
+    mode = input("Choose a mode (default 1): ").strip() or "1"
+    index_folder = input("Enter the index folder: ").strip()
+    if mode == "1":
+        extractions_path = input("Enter the extraction output folder or store file: ").strip()
+        normalize = input("Index canonical entity names (see entity_normalization.py)? (y/N): ").strip().lower() == "y"
+        merge = input("Merge all segments, dropping removed extractions? (y/N): ").strip().lower() == "y"
+        stats = update_index(extractions_path, index_folder, normalize, merge)
+        print(f"{stats['added']} extractions added, {stats['changed']} changed, {stats['removed']} removed "
+              f"in {index_folder}")
+    elif mode == "3":
+        index = EntityIndex(index_folder)
+        facet = input(f"Enter the facet ({'/'.join(FACETS)}): ").strip()
+        for value, count in index.values(facet):
+            print(f"{count}  {value}")
+    else:
+        index = EntityIndex(index_folder)
+        print(f"{len(index)} extractions indexed. Facets: {', '.join(FACETS)}")
+        print('Example: species:"asterias amurensis" AND role:invasive AND (ecosystem_type:marine OR ecosystem:"port phillip bay")')
+        while True:
+            query = input("Enter a query (empty to quit): ").strip()
+            if not query:
+                break
+            start = time.perf_counter()
+            try:
+                doc_ids = index.search(query)
+            except ValueError as e:
+                print(e)
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            for doc_id in doc_ids[:20]:
+                print(index.document(doc_id))
+            if len(doc_ids) > 20:
+                print(f"... and {len(doc_ids) - 20} more")
+            print(f"{len(doc_ids)} matching extractions ({elapsed:.1f} ms)")
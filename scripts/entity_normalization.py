@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+from extraction_store import iter_extractions
+
+# Bumped whenever the rules below change, so that counts made with older rules are recomputed
+RULES_VERSION = 1
+
+# Kinds of entity names that are normalized, named after the keys of an extraction
+ENTITY_KINDS = ('species', 'location', 'ecosystem', 'habitat')
+
+MARKDOWN_EMPHASIS = re.compile(r"[*_`]+")
+WHITESPACE = re.compile(r"\s+")
+# Quotes, brackets, and sentence punctuation around a name carry no meaning
+EDGE_PUNCTUATION = " \t\"'“”‘’«».,;:!?()[]{}"
+
+# A binomial, or a genus abbreviation and epithet ("L. peploides"), optionally with a subgenus and a
+# rank-marked infraspecific name. Whatever follows (authority, year, common name) is dropped
+BINOMIAL = re.compile(
+    r"^(?P<genus>[A-Z][a-z]+|[A-Z]\.)\s+(?:\([A-Z][a-z]+\)\s+)?(?P<epithet>[a-z][a-z-]+\.?)"
+    r"(?:\s+(?P<rank>subsp|ssp|var|f)\.?\s+(?P<infra>[a-z][a-z-]+))?(?P<rest>.*)$"
+)
+# Text after a binomial that starts like an authority or an annotation, e.g. "L.", "(Say, 1817)", "Walker 1858"
+AUTHORITY = re.compile(r"^\s*(?:$|[A-Z(\[&,]|\d|et al|ex\b)")
+GENUS_LEVEL_EPITHETS = {'sp', 'sp.', 'spp', 'spp.'}
+
+LOCATION_ARTICLE = re.compile(r"^the\s+", re.IGNORECASE)
+TRAILING_PARENTHETICAL = re.compile(r"\s*\([^()]*\)\s*$")
+
+# Function to normalize any name: Unicode compatibility forms, markdown emphasis, whitespace, surrounding
+# punctuation, and case
+def normalize_text(text):
+    text = unicodedata.normalize('NFKC', str(text))
+    text = MARKDOWN_EMPHASIS.sub('', text)
+    text = WHITESPACE.sub(' ', text).strip(EDGE_PUNCTUATION)
+    return text.casefold()
+
+# Function to reduce a species name to "genus epithet" (plus a rank-marked infraspecific name) without
+# authorities. A genus abbreviation is kept as "g. epithet" for the alias index to expand
+def normalize_species(name):
+    text = WHITESPACE.sub(' ', MARKDOWN_EMPHASIS.sub('', unicodedata.normalize('NFKC', str(name)))).strip(EDGE_PUNCTUATION)
+    match = BINOMIAL.match(text)
+    if match is None or not AUTHORITY.match(match.group('rest')):
+        return normalize_text(text)
+    genus, epithet = match.group('genus').casefold(), match.group('epithet').rstrip('.')
+    if epithet in GENUS_LEVEL_EPITHETS:
+        return f"{genus} sp."
+    canonical = f"{genus} {epithet}"
+    if match.group('infra'):
+        rank = 'subsp' if match.group('rank') == 'ssp' else match.group('rank')
+        canonical += f" {rank}. {match.group('infra')}"
+    return canonical
+
+# Function to reduce a location name to its head, e.g. "Port Phillip Bay, southern Australia" to "port phillip bay"
+def normalize_location(name):
+    head = str(name).split(',')[0]
+    # A name that is only a parenthetical, e.g. "(Norway)", keeps it
+    head = TRAILING_PARENTHETICAL.sub('', head) or head
+    return LOCATION_ARTICLE.sub('', normalize_text(head))
+
+RULES = {
+    'species': normalize_species,
+    'location': normalize_location,
+    'ecosystem': normalize_text,
+    'habitat': normalize_text,
+}
+
+# Function to build the abbreviated form of a binomial ("ludwigia peploides" to "l. peploides"), or None
+def abbreviate(canonical_species):
+    parts = canonical_species.split(' ')
+    if len(parts) < 2 or parts[0].endswith('.') or parts[1] == 'sp.':
+        return None
+    return ' '.join([f"{parts[0][0]}."] + parts[1:])
+
+# Map from normalized aliases to canonical names, per entity kind, persisted as a JSON file. Alias chains are
+# resolved when aliases are added, so a lookup is a single dictionary access
+class AliasIndex:
+    VERSION = 1
+
+    def __init__(self, aliases=None):
+        self.aliases = {kind: dict((aliases or {}).get(kind, {})) for kind in ENTITY_KINDS}
+
+    def lookup(self, kind, name):
+        return self.aliases[kind].get(name, name)
+
+    # Record that a normalized alias stands for a canonical name
+    def add(self, kind, alias, canonical):
+        self.add_many(kind, [(alias, canonical)])
+
+    # Record many (alias, canonical) pairs, then point every alias straight at the end of its chain
+    def add_many(self, kind, pairs):
+        aliases = self.aliases[kind]
+        for alias, canonical in pairs:
+            if alias != canonical:
+                aliases[alias] = canonical
+        for alias in list(aliases):
+            target, seen = aliases[alias], {alias}
+            while target in aliases and target not in seen:
+                seen.add(target)
+                target = aliases[target]
+            if target == alias:
+                del aliases[alias]  # A cycle back to itself makes the name canonical
+            else:
+                aliases[alias] = target
+
+    # Register the abbreviated forms of the given canonical species names, leaving out abbreviations that
+    # could stand for more than one species, such as "l. peploides" for two genera starting with L
+    def learn_abbreviations(self, species_names):
+        expansions = {}
+        for name in species_names:
+            abbreviation = abbreviate(self.lookup('species', name))
+            if abbreviation:
+                expansions.setdefault(abbreviation, set()).add(self.lookup('species', name))
+        pairs = [(abbreviation, canonicals.pop()) for abbreviation, canonicals in expansions.items()
+                 if len(canonicals) == 1 and abbreviation not in self.aliases['species']]
+        self.add_many('species', pairs)
+        return len(pairs)
+
+    def save(self, path):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': self.VERSION, 'aliases': self.aliases}, file, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file).get('aliases'))
+
+# Canonicalizer combining the normalization rules with an optional alias index. Canonical names are memoized
+# per raw string, so each distinct mention is normalized once and every later mention costs one lookup
+class EntityNormalizer:
+    def __init__(self, alias_index_path=None):
+        self.alias_index_path = alias_index_path
+        self.aliases = AliasIndex.load(alias_index_path) if alias_index_path and os.path.exists(alias_index_path) else AliasIndex()
+        self.memo = {kind: {} for kind in ENTITY_KINDS}
+
+    def canonical(self, kind, name):
+        memo = self.memo[kind]
+        if name not in memo:
+            memo[name] = self.aliases.lookup(kind, RULES[kind](name))
+        return memo[name]
+
+    # Identity of the rules and alias index in use, which changes whenever either changes
+    def fingerprint(self):
+        digest = hashlib.sha1(f"rules-{RULES_VERSION}".encode('utf-8'))
+        if self.alias_index_path and os.path.exists(self.alias_index_path):
+            with open(self.alias_index_path, 'rb') as file:
+                digest.update(file.read())
+        return digest.hexdigest()
+
+# Function to get the normalizer configured through the ENTITY_ALIAS_INDEX environment variable (rules only if unset)
+def default_normalizer():
+    return EntityNormalizer(os.environ.get("ENTITY_ALIAS_INDEX") or None)
+
+# Function to extend an alias index with the abbreviations of every species name found in the extractions
+def build_alias_index(extractions_path, alias_index_path):
+    aliases = AliasIndex.load(alias_index_path) if os.path.exists(alias_index_path) else AliasIndex()
+    species_names = set()
+    for data in iter_extractions(extractions_path):
+        for species in data.get('species') or []:
+            if isinstance(species, dict) and isinstance(species.get('name'), str):
+                species_names.add(normalize_species(species['name']))
+    added = aliases.learn_abbreviations(species_names)
+    aliases.save(alias_index_path)
+    return len(species_names), added
+
+if __name__ == "__main__":
+    alias_index_path = input("Enter the path to the alias index file (created if missing): ").strip()
+    print("Modes:")
+    print("  1. Learn species abbreviations from an extraction output folder or store")
+    print("  2. Add an alias")
+    print("  3. Show the canonical form of a name")
+    mode = input("Choose a mode (default 1): ").strip() or "1"
+    if mode == "2":
+        kind = input(f"Enter the entity kind ({'/'.join(ENTITY_KINDS)}): ").strip()
+        alias = RULES[kind](input("Enter the alias: ").strip())
+        canonical = RULES[kind](input("Enter the canonical name: ").strip())
+        aliases = AliasIndex.load(alias_index_path) if os.path.exists(alias_index_path) else AliasIndex()
+        aliases.add(kind, alias, canonical)
+        aliases.save(alias_index_path)
+        print(f"'{alias}' now resolves to '{aliases.lookup(kind, alias)}'")
+    elif mode == "3":
+        kind = input(f"Enter the entity kind ({'/'.join(ENTITY_KINDS)}): ").strip()
+        name = input("Enter the name: ").strip()
+        print(EntityNormalizer(alias_index_path).canonical(kind, name))
+    else:
+        extractions_path = input("Enter the extraction output folder or store file: ").strip()
+        species_count, added = build_alias_index(extractions_path, alias_index_path)
+        print(f"{species_count} distinct species names seen; {added} abbreviations added to {alias_index_path}")
@@ -0,0 +1,309 @@
+import json
+import os
+
+# Name of the consolidated store inside an extraction output folder, and the suffix of its offset index
+STORE_FILE = "extractions.jsonl"
+INDEX_SUFFIX = ".idx"
+
+# Layouts of an extraction output folder
+STORE_LAYOUT, FILES_LAYOUT = "store", "files"
+
+# Each extraction is stored under its sanitized DOI (the stem of its per-file output) as a record
+# {"key": ..., "doi": ..., "data": ...}, where data is the extraction object of a .json output or the
+# text of an N/A .txt output, such as "N/A" or "N/A (relevance pre-filter)"
+
+# Append-only JSONL file of extraction records with a tab-separated offset index (key, offset, length).
+# A key written again is superseded by its latest record; compact() drops the superseded records
+class ExtractionStore:
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.offsets = {}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(path, mode='ab+')
+        self._repair_tail()
+        self._load_index()
+        self.index_file = open(self.index_path, mode='a', encoding='utf-8')
+
+    # Drop a partial last line left by a run that stopped mid-write, so the next record starts on its own line
+    def _repair_tail(self):
+        self.file.seek(0, os.SEEK_END)
+        size = self.file.tell()
+        if size == 0:
+            return
+        self.file.seek(size - 1)
+        if self.file.read(1) == b'\n':
+            return
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            self.file.seek(position - step)
+            newline = self.file.read(step).rfind(b'\n')
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        self.file.truncate(position)
+
+    # Read the index, bringing it up to date with records appended after it was written, or rebuilding it
+    # if it does not match the data file
+    def _load_index(self):
+        self.file.seek(0, os.SEEK_END)
+        size = self.file.tell()
+        covered, last = 0, None
+        if os.path.exists(self.index_path):
+            with open(self.index_path, mode='r', encoding='utf-8') as index_file:
+                for line in index_file:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) != 3:
+                        continue
+                    key, offset, length = parts[0], int(parts[1]), int(parts[2])
+                    self.offsets[key] = (offset, length)
+                    if offset + length > covered:
+                        covered, last = offset + length, key
+        if covered > size or (last is not None and self._read_record(*self.offsets[last]).get('key') != last):
+            self.offsets, covered = {}, 0
+            open(self.index_path, mode='w', encoding='utf-8').close()
+        if covered < size:
+            with open(self.index_path, mode='a', encoding='utf-8') as index_file:
+                for offset, length, record in self._scan(covered):
+                    self.offsets[record['key']] = (offset, length)
+                    index_file.write(f"{record['key']}\t{offset}\t{length}\n")
+
+    # Yield (offset, length, record) for every record starting between two byte offsets, in file order
+    def _scan(self, start=0, end=None):
+        with open(self.path, mode='rb') as data_file:
+            data_file.seek(start)
+            offset = start
+            for line in data_file:
+                if end is not None and offset >= end:
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if isinstance(record, dict) and 'key' in record:
+                    yield offset, len(line), record
+                offset += len(line)
+
+    def _read_record(self, offset, length):
+        self.file.seek(offset)
+        try:
+            return json.loads(self.file.read(length))
+        except ValueError:
+            return {}
+
+    # Append the extraction of one DOI; data is an extraction object or an N/A text
+    def put(self, key, data, doi=None):
+        line = (json.dumps({'key': key, 'doi': doi, 'data': data}, ensure_ascii=False) + '\n').encode('utf-8')
+        self.file.seek(0, os.SEEK_END)
+        offset = self.file.tell()
+        self.file.write(line)
+        self.file.flush()
+        # The index line is written after the record, so an index is never ahead of its data file
+        self.index_file.write(f"{key}\t{offset}\t{len(line)}\n")
+        self.index_file.flush()
+        self.offsets[key] = (offset, len(line))
+
+    # Return the latest record of a key, or None
+    def get(self, key):
+        if key not in self.offsets:
+            return None
+        return self._read_record(*self.offsets[key])
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def keys(self):
+        return set(self.offsets)
+
+    # Return a version of every key that changes whenever the key is written again: its record's (offset, length)
+    def versions(self):
+        return dict(self.offsets)
+
+    # Yield the latest record of every key in one sequential scan of the data file, or of one shard of it
+    def iter_records(self, shard=None):
+        self.file.flush()
+        start, end = shard or (0, None)
+        for offset, _, record in self._scan(start, end):
+            if self.offsets.get(record['key'], (None,))[0] == offset:
+                yield record
+
+    # Split the data file into about count contiguous (start, end) byte ranges that begin at record boundaries
+    def shards(self, count):
+        self.file.flush()
+        size = os.path.getsize(self.path)
+        boundaries = [0]
+        with open(self.path, mode='rb') as data_file:
+            for number in range(1, count):
+                position = max(size * number // count, boundaries[-1])
+                data_file.seek(position)
+                if position > 0:
+                    data_file.readline()  # Move on to the start of the next record
+                boundaries.append(min(data_file.tell(), size))
+        boundaries.append(size)
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+    # Rewrite the store with only the latest record of every key
+    def compact(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, mode='wb') as temp_file:
+            for record in self.iter_records():
+                temp_file.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.close()
+        os.replace(temp_path, self.path)
+        os.remove(self.index_path)
+        self.__init__(self.path)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# The same interface over the original layout: one .json file per extraction and one .txt file per N/A answer
+class DirectoryStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file_path(self, key, extension):
+        return os.path.join(self.path, f"{key}{extension}")
+
+    def put(self, key, data, doi=None):
+        is_text = isinstance(data, str)
+        with open(self._file_path(key, '.txt' if is_text else '.json'), mode='w', encoding='utf-8') as file:
+            if is_text:
+                file.write(f"{data}\n")
+            else:
+                json.dump(data, file, indent=4)
+        # Remove the output of an earlier run whose answer differs in kind (N/A vs. extracted data)
+        stale_path = self._file_path(key, '.json' if is_text else '.txt')
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    # Return the record of a key, or None if it has no output file or its JSON cannot be decoded
+    def get(self, key):
+        for extension in ('.json', '.txt'):
+            if os.path.exists(self._file_path(key, extension)):
+                return self._read(f"{key}{extension}")
+        return None
+
+    def _read(self, filename):
+        key, extension = os.path.splitext(filename)
+        with open(os.path.join(self.path, filename), mode='r', encoding='utf-8') as file:
+            if extension == '.txt':
+                return {'key': key, 'doi': None, 'data': file.read().strip()}
+            try:
+                return {'key': key, 'doi': None, 'data': json.load(file)}
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON in file {filename}: {e}")
+                return None
+
+    def keys(self):
+        return {os.path.splitext(filename)[0] for filename in os.listdir(self.path)
+                if filename.endswith(('.json', '.txt'))}
+
+    def __contains__(self, key):
+        return any(os.path.exists(self._file_path(key, extension)) for extension in ('.json', '.txt'))
+
+    # Return a version of every key that changes whenever its output file is rewritten: (file name, mtime, size)
+    def versions(self):
+        versions = {}
+        for entry in os.scandir(self.path):
+            key, extension = os.path.splitext(entry.name)
+            # Like get(), prefer the .json output if a key has both
+            if extension == '.json' or (extension == '.txt' and key not in versions):
+                stat = entry.stat()
+                versions[key] = (entry.name, stat.st_mtime_ns, stat.st_size)
+        return versions
+
+    def __len__(self):
+        return len(self.keys())
+
+    def _filenames(self):
+        return sorted(filename for filename in os.listdir(self.path) if filename.endswith(('.json', '.txt')))
+
+    # Yield the record of every output file in file name order, or of the files of one shard
+    def iter_records(self, shard=None):
+        for filename in (shard if shard is not None else self._filenames()):
+            record = self._read(filename)
+            if record is not None:
+                yield record
+
+    # Split the sorted output files into about count contiguous lists of file names
+    def shards(self, count):
+        filenames = self._filenames()
+        size = -(-len(filenames) // max(1, count))
+        return [filenames[start:start + size] for start in range(0, len(filenames), max(1, size))]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Function to tell which layout an output folder uses: STORE_LAYOUT, FILES_LAYOUT, or None if it holds no outputs
+def detect_layout(directory):
+    if os.path.exists(os.path.join(directory, STORE_FILE)):
+        return STORE_LAYOUT
+    if os.path.isdir(directory) and any(name.endswith(('.json', '.txt')) for name in os.listdir(directory)):
+        return FILES_LAYOUT
+    return None
+
+# Function to open the extractions at a path: a store file, an output folder holding a store, or a per-file folder.
+# The layout only matters for a new output folder, which uses per-file outputs unless STORE_LAYOUT is asked for
+def open_extraction_store(path, layout=None):
+    if path.endswith('.jsonl'):
+        return ExtractionStore(path)
+    if (detect_layout(path) or layout) == STORE_LAYOUT:
+        return ExtractionStore(os.path.join(path, STORE_FILE))
+    return DirectoryStore(path)
+
+# Function to yield every extraction object at a path, skipping N/A answers, in one pass over the outputs
+# or over one of the shards returned by the store's shards()
+def iter_extractions(path, shard=None):
+    with open_extraction_store(path) as store:
+        for record in store.iter_records(shard):
+            if isinstance(record['data'], dict):
+                yield record['data']
+
+# Function to copy every output of one layout into another, e.g. a per-file folder into a store file
+def convert(source_path, target_path, target_layout=None):
+    count = 0
+    with open_extraction_store(source_path) as source, open_extraction_store(target_path, target_layout) as target:
+        for record in source.iter_records():
+            target.put(record['key'], record['data'], record.get('doi'))
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    print("Modes:")
+    print("  1. Pack a folder of per-DOI output files into a store")
+    print("  2. Unpack a store into per-DOI output files")
+    print("  3. Compact a store")
+    mode = input("Choose a mode (default 1): ").strip() or "1"
+    if mode == "3":
+        store_path = input("Enter the path to the store file or the output folder holding it: ").strip()
+        if not store_path.endswith('.jsonl'):
+            store_path = os.path.join(store_path, STORE_FILE)
+        with ExtractionStore(store_path) as store:
+            store.compact()
+            print(f"{len(store)} extractions kept in {store_path}")
+    else:
+        source_path = input("Enter the path to the source output folder or store file: ").strip()
+        target_path = input("Enter the path to the target output folder or store file: ").strip()
+        count = convert(source_path, target_path, STORE_LAYOUT if mode == "1" else FILES_LAYOUT)
+        print(f"{count} extractions copied from {source_path} to {target_path}")
@@ -1,6 +1,14 @@
-import requests
 import csv
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
 import pandas as pd
+from rate_limiter import TokenBucket
+from response_cache import default_cache
+
+# HTTP status codes worth retrying
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
 
 def sanitize(text):
     """
@@ -17,28 +25,64 @@ def sanitize_list(items):
     """
     return ', '.join([sanitize(item) for item in items if item])
 
-def search_publications(hypothesis):
+def search_publications(hypothesis, offset=0, limit=50, rate_limiter=None, max_retries=4, base_backoff=1.0):
     """
-    Perform an API GET request to search for the top 50 relevant publications based on a hypothesis.
+    Perform an API GET request for one page of publications relevant to a hypothesis.
+    Transient failures (rate limiting, server errors, connection problems) are retried with jittered
+    exponential backoff; anything else, or running out of retries, raises an exception.
     """
     url = 'https://api.ask.orkg.org/index/search'
     params = {
         'query': hypothesis,
-        'limit': 50#,
+        'limit': limit,
+        'offset': offset#,
         #'filter': 'year > 2010'  # Example filter, modify as needed
     }
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()['payload']['items']
-    else:
-        print(f"Failed to fetch data for hypothesis: {hypothesis}")
-        return []
+    for attempt in range(max_retries + 1):
+        try:
+            # Served from the local cache when available; only network requests are rate limited
+            response = default_cache().get(url, params=params, before_request=rate_limiter.acquire if rate_limiter else None)
+            if response.status_code == 200:
+                return response.json()['payload']['items']
+            if response.status_code not in TRANSIENT_STATUS_CODES or attempt == max_retries:
+                raise requests.exceptions.HTTPError(f"HTTP {response.status_code} for hypothesis: {hypothesis} (offset {offset})")
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == max_retries:
+                raise
+        delay = base_backoff * (2 ** attempt)
+        time.sleep(random.uniform(delay / 2, delay))
+
+def publication_row(hypothesis, pub):
+    """
+    Convert a publication returned by the search API into an output CSV row.
+    """
+    return {
+        'hypothesis': hypothesis,
+        'publication_id': pub.get('id', ''),
+        'title': sanitize(pub.get('title', '')),
+        'doi': pub.get('doi', ''),
+        'authors': sanitize(', '.join(pub.get('authors', []))),
+        'year': pub.get('year', ''),
+        'abstract': sanitize(pub.get('abstract', '')),
+        'full_text': sanitize(pub.get('full_text', '')),
+        'subjects': sanitize_list(pub.get('subjects', [])),
+        'topics': sanitize_list(pub.get('topics', [])),
+        'journals': sanitize_list(pub.get('journals', [])),
+        'publisher': sanitize(pub.get('publisher', ''))
+    }
 
-def main(input_file_path, output_file_path):
+def main(input_file_path, output_file_path, max_results=50, page_size=50, workers=4, requests_per_second=5):
     """
     Read hypotheses from an input CSV file, search for publications, and write results to an output CSV file.
+    All hypotheses are searched concurrently under a shared rate limit. Each hypothesis is paged through
+    offsets up to max_results, and rows are written as soon as each page arrives.
     """
     df = pd.read_csv(input_file_path)
+    hypotheses = list(dict.fromkeys(df['itemLabel.value'].dropna()))
+    rate_limiter = TokenBucket(requests_per_second)
+    seen_ids = {hypothesis: set() for hypothesis in hypotheses}
+    failed = []
+
     with open(output_file_path, mode='w', newline='', encoding='utf-8') as file:
         fieldnames = [
             'hypothesis', 'publication_id', 'title', 'doi', 'authors', 'year', 'abstract', 
@@ -46,27 +90,50 @@ def main(input_file_path, output_file_path):
         ]
         writer = csv.DictWriter(file, fieldnames=fieldnames)
         writer.writeheader()
-        
-        for hypothesis in df['itemLabel.value']:
-            print(f"Searching for: {hypothesis}")
-            publications = search_publications(hypothesis)
-            for pub in publications:
-                writer.writerow({
-                    'hypothesis': hypothesis,
-                    'publication_id': pub.get('id', ''),
-                    'title': sanitize(pub.get('title', '')),
-                    'doi': pub.get('doi', ''),
-                    'authors': sanitize(', '.join(pub.get('authors', []))),
-                    'year': pub.get('year', ''),
-                    'abstract': sanitize(pub.get('abstract', '')),
-                    'full_text': sanitize(pub.get('full_text', '')),
-                    'subjects': sanitize_list(pub.get('subjects', [])),
-                    'topics': sanitize_list(pub.get('topics', [])),
-                    'journals': sanitize_list(pub.get('journals', [])),
-                    'publisher': sanitize(pub.get('publisher', ''))
-                })
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def submit(hypothesis, offset):
+                limit = min(page_size, max_results - offset)
+                future = executor.submit(search_publications, hypothesis, offset, limit, rate_limiter)
+                in_flight[future] = (hypothesis, offset, limit)
+
+            in_flight = {}
+            for hypothesis in hypotheses:
+                print(f"Searching for: {hypothesis}")
+                submit(hypothesis, 0)
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    hypothesis, offset, limit = in_flight.pop(future)
+                    try:
+                        publications = future.result()
+                    except Exception as e:
+                        print(f"Failed to fetch data for hypothesis: {hypothesis} ({e})")
+                        failed.append(hypothesis)
+                        continue
+
+                    for pub in publications:
+                        # Pages can overlap if the index changes between requests
+                        pub_id = pub.get('id')
+                        if pub_id is not None and pub_id in seen_ids[hypothesis]:
+                            continue
+                        seen_ids[hypothesis].add(pub_id)
+                        writer.writerow(publication_row(hypothesis, pub))
+                    file.flush()
+
+                    # A full page means there may be more results below this depth
+                    if len(publications) == limit and offset + limit < max_results:
+                        submit(hypothesis, offset + limit)
+
+    print(f"Results for {len(hypotheses)} hypotheses written to {output_file_path}")
+    if failed:
+        print(f"Searches that failed after retries ({len(failed)}):")
+        for hypothesis in failed:
+            print(hypothesis)
 
 if __name__ == "__main__":
     input_file_path = 'C:\\Users\\dsouzaj\\Desktop\\Datasets\\orkg-ask-ecology\\wikidata-invasion-biology-corpus\\Hypotheses.csv'  # Path to the input CSV file containing hypotheses
     output_file_path = 'hypotheses-based-publications.csv'  # Path to the output CSV file to store the search results
-    main(input_file_path, output_file_path)
+    max_results = 50  # Number of top results to retrieve per hypothesis, fetched in pages of 50
+    main(input_file_path, output_file_path, max_results=max_results)
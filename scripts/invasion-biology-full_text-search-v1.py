@@ -1,6 +1,7 @@
 import csv
 import requests
 import json
+from response_cache import default_cache, cache_key
 
 # Input and output file paths
 input_file = "C:\\Users\\dsouzaj\\Desktop\\Datasets\\orkg-ask-ecology\\wikidata-invasion-biology-corpus\\Publications.csv"  # Replace with your actual input file path
@@ -17,7 +18,7 @@ def fetch_metadata(doi):
     # Construct the URL with the document_id being the DOI
     url = f"{base_url}{doi}"
     try:
-        response = requests.get(url)
+        response = default_cache().get(url, key=cache_key("ask-get", doi))  # Served from the local cache when available
         response.raise_for_status()
         data = response.json().get("payload", {})
         
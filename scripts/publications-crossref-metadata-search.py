@@ -2,71 +2,138 @@ import csv
 import requests
 import time
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from doi_index import iter_dois, ProcessedDOIIndex
+from rate_limiter import AdaptiveRateLimiter
+from response_cache import default_cache, cache_key
 
-# Function to get metadata from Crossref API using DOI
-def get_metadata_from_doi(doi, failed_dois_file):
+# Lock so that worker threads do not interleave lines in the failed DOIs file
+failed_dois_lock = threading.Lock()
+
+# Function to log a DOI whose metadata could not be fetched
+def log_failed_doi(doi, failed_dois_file):
+    with failed_dois_lock:
+        with open(failed_dois_file, mode='a', newline='', encoding='utf-8') as failed_file:
+            writer = csv.writer(failed_file)
+            writer.writerow([doi])
+
+# Function to create a connection-pooled session that identifies itself for Crossref's polite pool
+def create_session(workers=1, mailto=None):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, workers))
+    session.mount("https://", adapter)
+    user_agent = "invasion-biology-IE/1.0 (https://github.com/jd-coderepos/invasion-biology-IE"
+    session.headers["User-Agent"] = f"{user_agent}; mailto:{mailto})" if mailto else f"{user_agent})"
+    return session
+
+# Function to extract the required metadata fields from a Crossref work message
+def parse_metadata(message):
+    # Extract the published-print date parts
+    date_parts_print = message.get('published-print', {}).get('date-parts', [['N/A', 'N/A', 'N/A']])[0]
+    print_year = date_parts_print[0] if len(date_parts_print) > 0 else 'N/A'
+    print_month = date_parts_print[1] if len(date_parts_print) > 1 else 'N/A'
+    print_day = date_parts_print[2] if len(date_parts_print) > 2 else 'N/A'
+
+    # Extract the published date parts (general published)
+    date_parts_published = message.get('published', {}).get('date-parts', [['N/A', 'N/A', 'N/A']])[0]
+    pub_year = date_parts_published[0] if len(date_parts_published) > 0 else 'N/A'
+    pub_month = date_parts_published[1] if len(date_parts_published) > 1 else 'N/A'
+    pub_day = date_parts_published[2] if len(date_parts_published) > 2 else 'N/A'
+
+    # Handle empty container-title gracefully
+    journal_title = message.get('container-title', [])
+    journal = journal_title[0] if journal_title else 'N/A'
+
+    # Handle empty title gracefully
+    title = message.get('title', [])
+    title = title[0] if title else 'N/A'
+
+    # Extract the required metadata
+    metadata = {
+        "DOI": message.get('DOI', 'N/A'),
+        "Title": title,
+        "Type": message.get('type', 'N/A'),
+        "Published Print Year": print_year,
+        "Published Print Month": print_month,
+        "Published Print Day": print_day,
+        "Published Year": pub_year,
+        "Published Month": pub_month,
+        "Published Day": pub_day,
+        "Journal": journal,
+        "Volume": message.get('volume', 'N/A'),
+        "Issue": message.get('issue', 'N/A'),
+        "Page Range": message.get('page', 'N/A'),
+        "Publisher": message.get('publisher', 'N/A'),
+        "Authors": ", ".join([f"{author.get('given', '')} {author.get('family', '')}".strip() for author in message.get('author', [])]),
+        "Is Referenced By Count": message.get('is-referenced-by-count', 'N/A'),
+        "Subtitle": ", ".join(message.get('subtitle', [])) if message.get('subtitle') else 'N/A',
+        "Short Title": ", ".join(message.get('short-title', [])) if message.get('short-title') else 'N/A'
+    }
+    return metadata
+
+# Function to get metadata from Crossref API using DOI, retrying with backoff when the rate limit is hit
+def get_metadata_from_doi(doi, failed_dois_file, session=None, rate_limiter=None, max_retries=5, backoff_time=12):
     api_url = f"https://api.crossref.org/works/{doi}"
+    session = session or requests
     try:
-        response = requests.get(api_url)
-        if response.status_code == 429:  # Rate limit hit, need to back off
-            print(f"Rate limit reached. Backing off for 12 seconds...")
-            time.sleep(12)  # Backoff for 12 seconds
-            return get_metadata_from_doi(doi, failed_dois_file)  # Retry the request after backoff
-        response.raise_for_status()  # Raise an error for other bad status codes
-        data = response.json()
-        if data['status'] == 'ok':
-            message = data['message']
-            
-            # Extract the published-print date parts
-            date_parts_print = message.get('published-print', {}).get('date-parts', [['N/A', 'N/A', 'N/A']])[0]
-            print_year = date_parts_print[0] if len(date_parts_print) > 0 else 'N/A'
-            print_month = date_parts_print[1] if len(date_parts_print) > 1 else 'N/A'
-            print_day = date_parts_print[2] if len(date_parts_print) > 2 else 'N/A'
-            
-            # Extract the published date parts (general published)
-            date_parts_published = message.get('published', {}).get('date-parts', [['N/A', 'N/A', 'N/A']])[0]
-            pub_year = date_parts_published[0] if len(date_parts_published) > 0 else 'N/A'
-            pub_month = date_parts_published[1] if len(date_parts_published) > 1 else 'N/A'
-            pub_day = date_parts_published[2] if len(date_parts_published) > 2 else 'N/A'
-            
-            # Handle empty container-title gracefully
-            journal_title = message.get('container-title', [])
-            journal = journal_title[0] if journal_title else 'N/A'
-            
-            # Handle empty title gracefully
-            title = message.get('title', [])
-            title = title[0] if title else 'N/A'
-            
-            # Extract the required metadata
-            metadata = {
-                "DOI": message.get('DOI', 'N/A'),
-                "Title": title,
-                "Type": message.get('type', 'N/A'),
-                "Published Print Year": print_year,
-                "Published Print Month": print_month,
-                "Published Print Day": print_day,
-                "Published Year": pub_year,
-                "Published Month": pub_month,
-                "Published Day": pub_day,
-                "Journal": journal,
-                "Volume": message.get('volume', 'N/A'),
-                "Issue": message.get('issue', 'N/A'),
-                "Page Range": message.get('page', 'N/A'),
-                "Publisher": message.get('publisher', 'N/A'),
-                "Authors": ", ".join([f"{author.get('given', '')} {author.get('family', '')}".strip() for author in message.get('author', [])]),
-                "Is Referenced By Count": message.get('is-referenced-by-count', 'N/A'),
-                "Subtitle": ", ".join(message.get('subtitle', [])) if message.get('subtitle') else 'N/A',
-                "Short Title": ", ".join(message.get('short-title', [])) if message.get('short-title') else 'N/A'
-            }
-            return metadata
+        for attempt in range(max_retries + 1):
+            # Responses are served from the local cache when available; only network requests are rate limited
+            response = default_cache().get(api_url, key=cache_key('crossref-works', doi), session=session,
+                                           before_request=rate_limiter.acquire if rate_limiter else None)
+            if rate_limiter and not getattr(response, 'from_cache', False):
+                rate_limiter.update_from_headers(response.headers)
+
+            if response.status_code == 429:  # Rate limit hit, need to back off
+                if rate_limiter:
+                    rate_limiter.slow_down()
+                if attempt == max_retries:
+                    break
+                retry_after = response.headers.get('Retry-After', '')
+                delay = int(retry_after) if retry_after.isdigit() else min(backoff_time * (2 ** attempt), 300)
+                print(f"Rate limit reached for DOI {doi}. Backing off for {delay} seconds...")
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()  # Raise an error for other bad status codes
+            data = response.json()
+            if data['status'] == 'ok':
+                return parse_metadata(data['message'])
+            return None
+
+        print(f"Giving up on DOI {doi} after {max_retries} retries.")
     except requests.exceptions.RequestException as e:
         print(f"Error fetching metadata for DOI {doi}: {e}")
-        # Log the failed DOI to the file
-        with open(failed_dois_file, mode='a', newline='', encoding='utf-8') as failed_file:
-            writer = csv.writer(failed_file)
-            writer.writerow([doi])
+    # Log the failed DOI to the file
+    log_failed_doi(doi, failed_dois_file)
     return None
 
+# Function to fetch metadata for DOIs with a bounded number of requests in flight, at the rate Crossref allows
+def fetch_metadata_concurrently(dois, failed_dois_file, workers, mailto=None, initial_rate=10):
+    session = create_session(workers, mailto)
+    rate_limiter = AdaptiveRateLimiter(initial_rate)
+    max_in_flight = workers * 2  # Keep the pool busy without queueing the whole input
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for doi in dois:
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+            in_flight[executor.submit(get_metadata_from_doi, doi, failed_dois_file, session, rate_limiter)] = doi
+
+        for future in list(in_flight):
+            yield in_flight.pop(future), future.result()
+
+# Function to fetch metadata for DOIs one at a time, with the same polite-pool session and
+# header-driven rate limit as the concurrent mode
+def fetch_metadata_sequentially(dois, failed_dois_file, mailto=None, initial_rate=10):
+    session = create_session(1, mailto)
+    rate_limiter = AdaptiveRateLimiter(initial_rate)
+    for doi in dois:
+        yield doi, get_metadata_from_doi(doi, failed_dois_file, session, rate_limiter)
+
 # Function to save progress after every batch
 def write_results_to_file(output_file_path, results, write_header=False):
     fieldnames = [
@@ -82,13 +149,6 @@ def write_results_to_file(output_file_path, results, write_header=False):
             writer.writeheader()
         writer.writerows(results)
 
-# Function to track processed DOIs in a file and resume from where it left off
-def get_processed_dois(processed_dois_file):
-    if os.path.exists(processed_dois_file):
-        with open(processed_dois_file, mode='r', newline='', encoding='utf-8') as file:
-            return set(line.strip() for line in file)
-    return set()
-
 # Function to append processed DOIs in batch after writing to the output file
 def append_processed_dois(processed_dois_file, processed_dois):
     with open(processed_dois_file, mode='a', newline='', encoding='utf-8') as file:
@@ -96,34 +156,37 @@ def append_processed_dois(processed_dois_file, processed_dois):
             file.write(f"{doi}\n")
 
 # Main function to read DOIs from CSV, fetch metadata, and save progress periodically
-def process_csv_and_fetch_metadata(csv_file_path, output_file_path, failed_dois_file, processed_dois_file, batch_size=100):
-    processed_dois_set = get_processed_dois(processed_dois_file)
+def process_csv_and_fetch_metadata(csv_file_path, output_file_path, failed_dois_file, processed_dois_file, batch_size=100, workers=1, mailto=None):
+    processed_dois_set = ProcessedDOIIndex(processed_dois_file)  # Probed on disk instead of loaded into memory
     results = []
     batch_dois = []  # Track DOIs for the current batch
     count = 0
     write_header = not os.path.exists(output_file_path)  # Write header if file doesn't exist
 
-    # Open the CSV file and read rows
-    with open(csv_file_path, mode='r', newline='', encoding='utf-8') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            doi = row.get('doi.value', '').strip()
-            if doi and doi not in processed_dois_set:
-                metadata = get_metadata_from_doi(doi, failed_dois_file)
-                if metadata:
-                    results.append(metadata)
-                    batch_dois.append(doi)  # Add DOI to the current batch
-                    count += 1
-                
-                # Every batch_size (e.g., 100), write the results and processed DOIs to the files
-                if count % batch_size == 0:
-                    write_results_to_file(output_file_path, results, write_header)
-                    append_processed_dois(processed_dois_file, batch_dois)
-                    results = []  # Reset the results list
-                    batch_dois = []  # Reset the batch DOI list
-                    write_header = False  # Only write header once
-                    print(f"Processed {count} records so far.")
-        
+    # Stream the DOIs from the CSV file
+    with processed_dois_set:
+        pending_dois = (doi for doi in iter_dois(csv_file_path, columns=('doi.value',)) if doi not in processed_dois_set)
+        if workers > 1:
+            fetched = fetch_metadata_concurrently(pending_dois, failed_dois_file, workers, mailto)
+        else:
+            fetched = fetch_metadata_sequentially(pending_dois, failed_dois_file, mailto)
+
+        # Results are written from the main thread only, so the output files need no locking
+        for doi, metadata in fetched:
+            if metadata:
+                results.append(metadata)
+                batch_dois.append(doi)  # Add DOI to the current batch
+                count += 1
+
+            # Every batch_size (e.g., 100), write the results and processed DOIs to the files
+            if len(results) >= batch_size:
+                write_results_to_file(output_file_path, results, write_header)
+                append_processed_dois(processed_dois_file, batch_dois)
+                results = []  # Reset the results list
+                batch_dois = []  # Reset the batch DOI list
+                write_header = False  # Only write header once
+                print(f"Processed {count} records so far.")
+
         # Write any remaining results and DOIs at the end
         if results:
             write_results_to_file(output_file_path, results, write_header)
@@ -138,10 +201,12 @@ csv_file_path = "..\\wikidata-invasion-biology-corpus\\Publications.csv"  # Path
 output_file_path = "..\\data\\all-publications\\crossref-metadata\\publications_metadata.csv"  # Path to save the fetched metadata
 failed_dois_file = "..\\data\\all-publications\\crossref-metadata\\failed_dois.csv"  # Path to save the DOIs that failed
 processed_dois_file = "..\\data\\all-publications\\crossref-metadata\\processed_dois.txt"  # File to keep track of processed DOIs
+workers = 8  # Number of concurrent requests; the request rate follows Crossref's X-Rate-Limit headers
+mailto = os.environ.get("CROSSREF_MAILTO")  # Contact email for Crossref's polite pool
 
 # Ensure the failed DOIs file is initialized with headers
 with open(failed_dois_file, mode='w', newline='', encoding='utf-8') as failed_file:
     writer = csv.writer(failed_file)
     writer.writerow(["DOI"])
 
-process_csv_and_fetch_metadata(csv_file_path, output_file_path, failed_dois_file, processed_dois_file)
+process_csv_and_fetch_metadata(csv_file_path, output_file_path, failed_dois_file, processed_dois_file, workers=workers, mailto=mailto)
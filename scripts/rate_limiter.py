@@ -0,0 +1,73 @@
+import re
+import threading
+import time
+
+# Token-bucket rate limiter shared by all worker threads
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)  # Tokens added per second
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Block until enough tokens are available, then consume them
+    def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)  # A request larger than the bucket waits for a full bucket
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    # Change the refill rate, keeping the tokens accumulated so far
+    def set_rate(self, rate, capacity=None):
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+            self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+# Function to parse an interval header such as "1s", "500ms" or "1m" into seconds
+def parse_interval(value):
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*', str(value))
+    if not match:
+        return None
+    number, unit = float(match.group(1)), match.group(2) or 's'
+    return number * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+
+# Token bucket that follows the X-Rate-Limit-Limit / X-Rate-Limit-Interval headers sent by the API,
+# and halves its rate whenever the API answers with HTTP 429
+class AdaptiveRateLimiter(TokenBucket):
+    def __init__(self, rate, min_rate=0.5, safety_factor=0.9):
+        super().__init__(rate)
+        self.min_rate = min_rate
+        self.safety_factor = safety_factor  # Stay slightly below the advertised limit
+        self.advertised_rate = None
+
+    # Adopt the rate advertised in the response headers, if any
+    def update_from_headers(self, headers):
+        limit = headers.get('X-Rate-Limit-Limit')
+        interval = parse_interval(headers.get('X-Rate-Limit-Interval', ''))
+        if not limit or not interval:
+            return
+        try:
+            advertised_rate = int(limit) / interval * self.safety_factor
+        except ValueError:
+            return
+        if advertised_rate != self.advertised_rate:
+            self.advertised_rate = advertised_rate
+            print(f"Rate limit advertised by the API: {limit} requests per {interval:g}s")
+            self.set_rate(max(self.min_rate, advertised_rate))
+
+    # Back off after HTTP 429 by halving the current rate
+    def slow_down(self):
+        self.set_rate(max(self.min_rate, self.rate / 2))
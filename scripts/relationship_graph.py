@@ -0,0 +1,314 @@
+import json
+import os
+import sys
+import time
+from array import array
+from collections import deque
+
+from entity_normalization import ENTITY_KINDS, default_normalizer, normalize_text
+from extraction_store import open_extraction_store
+
+# Version of the files written by RelationshipGraph.save; graphs of another version must be rebuilt
+GRAPH_VERSION = 2
+GRAPH_FILE = "graph.json"
+
+# Typecodes of the adjacency arrays, each saved as a raw <name>.bin file next to graph.json:
+#   offsets[node] .. offsets[node + 1] are the positions of the node's edges in targets and relations,
+#   doc_offsets[edge] .. doc_offsets[edge + 1] are the positions of the edge's documents in docs
+ARRAYS = {'offsets': 'q', 'targets': 'i', 'relations': 'i', 'doc_offsets': 'q', 'docs': 'i'}
+
+# Kind of the related entities that are not among the entities listed in their own extraction
+OTHER_KIND = 'entity'
+# Order in which a related entity is looked up among the listed entities, when a name is listed under several kinds
+RESOLUTION_ORDER = ('species', 'location', 'habitat', 'ecosystem')
+# Directions of an edge, the third element of its relation: from an earlier to a later entity of a unidirectional
+# relationship (or from a habitat to its ecosystem), the reverse, or between the entities of any other relationship
+OUTGOING, INCOMING, UNDIRECTED = 1, -1, 0
+# (type, name) of the edges from a habitat to the ecosystem it is part of
+SUBCOMPONENT_RELATION = ('subcomponent_of', 'subcomponent_of')
+
+# Function to get the name of an entity or a related entity, which the extractions give as a string or an object
+def _entity_name(entity):
+    if isinstance(entity, dict):
+        entity = entity.get('name')
+    return entity.strip() if isinstance(entity, str) and entity.strip() else None
+
+# Collects the nodes, relations, documents, and edges of a graph while the extractions are streamed, then packs
+# them into the arrays of a RelationshipGraph. Nodes are identified by (kind, name), where the name is the
+# canonical name with normalization and the name with case and whitespace folded without it
+class GraphBuilder:
+    def __init__(self, normalizer=None):
+        self.normalizer = normalizer
+        self.nodes = {}
+        self.relations = {}
+        self.documents = []
+        # (source, target, relation) -> ids of the documents asserting the edge, in document order, where the
+        # relation is the id of a (type, name, direction) triple
+        self.edges = {}
+
+    def _identify(self, kind, name):
+        if self.normalizer is not None and kind in ENTITY_KINDS:
+            return self.normalizer.canonical(kind, name) or normalize_text(name)
+        return normalize_text(name)
+
+    def _node(self, kind, name):
+        return self.nodes.setdefault((kind, name), len(self.nodes))
+
+    def _relation(self, relation):
+        return self.relations.setdefault(relation, len(self.relations))
+
+    def _link(self, source, target, relation, document, directed=False):
+        if source == target:
+            return
+        # Edges are kept in both directions, so that every query only follows outgoing edges; the direction in the
+        # relation tells the two apart for directed relationships
+        forward = self._relation(relation + (OUTGOING if directed else UNDIRECTED,))
+        backward = self._relation(relation + (INCOMING if directed else UNDIRECTED,))
+        for edge in ((source, target, forward), (target, source, backward)):
+            documents = self.edges.setdefault(edge, [])
+            if not documents or documents[-1] != document:
+                documents.append(document)
+
+    # Add the entities and relationships of one extraction, asserted by the given document (a DOI or output key)
+    def add_extraction(self, data, document):
+        document_id = len(self.documents)
+        self.documents.append(document)
+
+        # Related entities are named like the listed entities, so they are resolved through the names listed here
+        listed = {}
+        for kind in RESOLUTION_ORDER:
+            for entity in data.get(kind) or []:
+                name = _entity_name(entity)
+                if name is not None:
+                    node = self._node(kind, self._identify(kind, name))
+                    for key in {name.casefold(), normalize_text(name)}:
+                        listed.setdefault(key, node)
+
+        for habitat in data.get('habitat') or []:
+            if not isinstance(habitat, dict):
+                continue
+            name = _entity_name(habitat)
+            ecosystem = _entity_name((habitat.get('properties') or {}).get('subcomponent_of'))
+            if name is not None and ecosystem is not None:
+                self._link(self._node('habitat', self._identify('habitat', name)),
+                           self._node('ecosystem', self._identify('ecosystem', ecosystem)),
+                           SUBCOMPONENT_RELATION, document_id, directed=True)
+
+        for relationship in data.get('relationships') or []:
+            if not isinstance(relationship, dict):
+                continue
+            properties = relationship.get('relationship_properties') or {}
+            relation = (str(properties.get('type', 'unknown')), str(properties.get('name', 'unknown')))
+            # Related entities of a unidirectional relationship are listed from source to target
+            directed = str(properties.get('directionality', '')).strip().lower() == 'unidirectional'
+            nodes = []
+            for entity in relationship.get('related_entities') or []:
+                name = _entity_name(entity)
+                if name is None:
+                    continue
+                node = listed.get(name.casefold())
+                if node is None:
+                    node = listed.get(normalize_text(name))
+                if node is None:
+                    node = self._node(OTHER_KIND, normalize_text(name))
+                if node not in nodes:
+                    nodes.append(node)
+            for position, source in enumerate(nodes):
+                for target in nodes[position + 1:]:
+                    self._link(source, target, relation, document_id, directed)
+
+    # Pack the collected edges into compressed sparse rows, sorted by source, target, and relation
+    def build(self):
+        arrays = {name: array(typecode) for name, typecode in ARRAYS.items()}
+        offsets, targets, relations = arrays['offsets'], arrays['targets'], arrays['relations']
+        doc_offsets, docs = arrays['doc_offsets'], arrays['docs']
+        offsets.append(0)
+        doc_offsets.append(0)
+        source = 0
+        for edge in sorted(self.edges):
+            while source < edge[0]:
+                offsets.append(len(targets))
+                source += 1
+            targets.append(edge[1])
+            relations.append(edge[2])
+            docs.extend(self.edges[edge])
+            doc_offsets.append(len(docs))
+        while len(offsets) <= len(self.nodes):
+            offsets.append(len(targets))
+
+        metadata = {
+            'version': GRAPH_VERSION,
+            'normalization': self.normalizer.fingerprint() if self.normalizer is not None else None,
+            'nodes': [list(node) for node in self.nodes],
+            'relations': [list(relation) for relation in self.relations],
+            'documents': self.documents,
+        }
+        return RelationshipGraph(metadata, arrays)
+
+# Function to build the graph of an extraction output folder or store in one pass over the extractions.
+# Each extraction is attributed to its DOI when the store records it, and to its output key otherwise
+def build_graph(path, normalize=False):
+    builder = GraphBuilder(default_normalizer() if normalize else None)
+    with open_extraction_store(path) as store:
+        for record in store.iter_records():
+            if isinstance(record['data'], dict):
+                builder.add_extraction(record['data'], record.get('doi') or record['key'])
+    return builder.build()
+
+# Graph of species, locations, habitats, ecosystems, and other related entities, with typed edges carrying the
+# documents that assert them. The adjacency is held in flat integer arrays (compressed sparse rows), so that a
+# saved graph reloads by reading the arrays straight from disk and a query only touches the edges it follows
+class RelationshipGraph:
+    def __init__(self, metadata, arrays):
+        self.metadata = metadata
+        self.nodes = [tuple(node) for node in metadata['nodes']]
+        self.relations = [tuple(relation) for relation in metadata['relations']]
+        self.documents = metadata['documents']
+        self.offsets, self.targets, self.relation_ids = arrays['offsets'], arrays['targets'], arrays['relations']
+        self.doc_offsets, self.docs = arrays['doc_offsets'], arrays['docs']
+        self.ids = {node: position for position, node in enumerate(self.nodes)}
+        self.normalizer = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def edge_count(self):
+        return len(self.targets)
+
+    def save(self, graph_folder):
+        os.makedirs(graph_folder, exist_ok=True)
+        arrays = {'offsets': self.offsets, 'targets': self.targets, 'relations': self.relation_ids,
+                  'doc_offsets': self.doc_offsets, 'docs': self.docs}
+        for name, values in arrays.items():
+            with open(os.path.join(graph_folder, f"{name}.bin"), 'wb') as file:
+                values.tofile(file)
+        sizes = {name: len(values) for name, values in arrays.items()}
+        metadata = dict(self.metadata, sizes=sizes, byteorder=sys.byteorder)
+        # Written last, so that a graph folder is only complete once its metadata matches its arrays
+        temp_path = os.path.join(graph_folder, f"{GRAPH_FILE}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(metadata, ensure_ascii=False, separators=(',', ':')))
+        os.replace(temp_path, os.path.join(graph_folder, GRAPH_FILE))
+
+    @classmethod
+    def load(cls, graph_folder):
+        with open(os.path.join(graph_folder, GRAPH_FILE), 'r', encoding='utf-8') as file:
+            metadata = json.load(file)
+        if metadata.get('version') != GRAPH_VERSION:
+            raise ValueError(f"{graph_folder} holds a graph of version {metadata.get('version')}; rebuild it")
+        if metadata['normalization'] is not None and metadata['normalization'] != default_normalizer().fingerprint():
+            print(f"Warning: {graph_folder} was built with other normalization rules or aliases than the current ones; "
+                  f"rebuild it so that entities are identified by their current canonical names")
+        arrays = {}
+        for name, typecode in ARRAYS.items():
+            values = array(typecode)
+            with open(os.path.join(graph_folder, f"{name}.bin"), 'rb') as file:
+                values.fromfile(file, metadata['sizes'][name])
+            if metadata['byteorder'] != sys.byteorder:
+                values.byteswap()
+            arrays[name] = values
+        return cls(metadata, arrays)
+
+    # Return the id of a node, identifying its name the way the graph was built, or None if it is not in the graph
+    def node_id(self, kind, name):
+        if self.metadata['normalization'] is not None and kind in ENTITY_KINDS:
+            if self.normalizer is None:
+                self.normalizer = default_normalizer()
+            node = self.ids.get((kind, self.normalizer.canonical(kind, name)))
+            if node is not None:
+                return node
+        return self.ids.get((kind, normalize_text(name)))
+
+    # Tell whether an edge has the given relation type and direction (OUTGOING, INCOMING, or UNDIRECTED), where
+    # None matches any
+    def _matches(self, edge, relation_type, direction):
+        relation = self.relations[self.relation_ids[edge]]
+        return (relation_type is None or relation[0] == relation_type) and (direction is None or relation[2] == direction)
+
+    # Yield (target, (relation type, relation name, direction), document ids) for every edge of a node, optionally
+    # only the edges to nodes of one kind, of one relation type, or in one direction
+    def neighbors(self, node, kind=None, relation_type=None, direction=None):
+        for edge in range(self.offsets[node], self.offsets[node + 1]):
+            target = self.targets[edge]
+            if (kind is None or self.nodes[target][0] == kind) and self._matches(edge, relation_type, direction):
+                yield target, self.relations[self.relation_ids[edge]], self.docs[self.doc_offsets[edge]:self.doc_offsets[edge + 1]]
+
+    # List the nodes of one kind linked to a node, e.g. all habitats linked to a species, as
+    # (target, relations, document ids) with the relations and documents of all edges between the two merged
+    def linked(self, node, kind=None, relation_type=None, direction=None):
+        linked = {}
+        for target, relation, documents in self.neighbors(node, kind, relation_type, direction):
+            relations, target_documents = linked.setdefault(target, (set(), set()))
+            relations.add(relation)
+            target_documents.update(documents)
+        return [(target, sorted(relations), sorted(documents)) for target, (relations, documents) in linked.items()]
+
+    # Return {node: hops} for every node within the given number of hops of a node, found breadth first, e.g.
+    # only following OUTGOING edges for what a species affects, directly or not
+    def neighborhood(self, node, hops, relation_type=None, direction=None):
+        distances = {node: 0}
+        queue = deque([node])
+        while queue:
+            current = queue.popleft()
+            if distances[current] == hops:
+                continue
+            for edge in range(self.offsets[current], self.offsets[current + 1]):
+                target = self.targets[edge]
+                if target not in distances and self._matches(edge, relation_type, direction):
+                    distances[target] = distances[current] + 1
+                    queue.append(target)
+        return distances
+
+def _ask_direction():
+    answer = input("Follow only outgoing or incoming directed links? (out/in, empty for all): ").strip().lower()
+    return {'out': OUTGOING, 'in': INCOMING}.get(answer)
+
+def _ask_node(graph):
+    kind = input(f"Enter the entity kind ({'/'.join(RESOLUTION_ORDER + (OTHER_KIND,))}): ").strip()
+    name = input("Enter the entity name: ").strip()
+    node = graph.node_id(kind, name)
+    if node is None:
+        print(f"No {kind} named '{name}' in the graph")
+    return node
+
+if __name__ == "__main__":
+    print("Modes:")
+    print("  1. Build the graph of an extraction output folder or store")
+    print("  2. List the entities linked to an entity")
+    print("  3. List the neighborhood of an entity")
+    mode = input("Choose a mode (default 1): ").strip() or "1"
+    graph_folder = input("Enter the graph folder: ").strip()
+    if mode == "1":
+        extractions_path = input("Enter the extraction output folder or store file: ").strip()
+        normalize = input("Identify entities by their canonical names (see entity_normalization.py)? (y/N): ").strip().lower() == "y"
+        graph = build_graph(extractions_path, normalize)
+        graph.save(graph_folder)
+        print(f"{len(graph)} entities and {graph.edge_count() // 2} links from {len(graph.documents)} extractions "
+              f"saved to {graph_folder}")
+    else:
+        graph = RelationshipGraph.load(graph_folder)
+        node = _ask_node(graph)
+        if node is not None and mode == "2":
+            kind = input("Enter the kind of the linked entities (empty for all): ").strip() or None
+            direction = _ask_direction()
+            start = time.perf_counter()
+            linked = graph.linked(node, kind, direction=direction)
+            elapsed = (time.perf_counter() - start) * 1000
+            for target, relations, documents in sorted(linked, key=lambda item: (-len(item[2]), graph.nodes[item[0]])):
+                target_kind, target_name = graph.nodes[target]
+                arrows = {OUTGOING: ' ->', INCOMING: ' <-', UNDIRECTED: ''}
+                relation_names = '; '.join(f"{relation_type}: {name}{arrows[relation_direction]}"
+                                           for relation_type, name, relation_direction in relations[:3])
+                print(f"{target_kind}  {target_name}  [{relation_names}]  ({len(documents)} documents, "
+                      f"e.g. {graph.documents[documents[0]]})")
+            print(f"{len(linked)} linked entities ({elapsed:.1f} ms)")
+        elif node is not None:
+            hops = int(input("Enter the number of hops (default 2): ").strip() or 2)
+            direction = _ask_direction()
+            start = time.perf_counter()
+            distances = graph.neighborhood(node, hops, direction=direction)
+            elapsed = (time.perf_counter() - start) * 1000
+            for target, distance in sorted(distances.items(), key=lambda item: (item[1], graph.nodes[item[0]])):
+                if distance:
+                    print(f"{distance}  {graph.nodes[target][0]}  {graph.nodes[target][1]}")
+            print(f"{len(distances) - 1} entities within {hops} hops ({elapsed:.1f} ms)")
@@ -0,0 +1,147 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+import requests
+
+# Settings shared by all scripts, overridable through environment variables
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "invasion-biology-IE", "responses.sqlite")
+DEFAULT_TTL_DAYS = 30
+
+# Raised in offline mode when a response is not in the cache
+class CacheMiss(requests.exceptions.RequestException):
+    pass
+
+# Response served from the cache, exposing the parts of requests.Response the scripts use
+class CachedResponse:
+    from_cache = True
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass  # Only successful responses are cached
+
+# Function to build a cache key from an endpoint name and a DOI or query, ignoring case and whitespace
+def cache_key(endpoint, identifier):
+    return f"{endpoint}|{str(identifier).strip().lower()}"
+
+# On-disk HTTP response cache keyed by endpoint and normalized DOI or query. Bodies are stored
+# zlib-compressed; entries older than the TTL are revalidated with ETag/Last-Modified when possible
+class ResponseCache:
+    def __init__(self, path=None, ttl_days=None, offline=None):
+        self.path = path or os.environ.get("RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.ttl = float(ttl_days if ttl_days is not None else os.environ.get("RESPONSE_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS)) * 86400
+        self.offline = offline if offline is not None else os.environ.get("RESPONSE_CACHE_OFFLINE", "") not in ("", "0")
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                body BLOB,
+                content_type TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL
+            )
+        """)
+        self.connection.commit()
+
+    # Return the cached entry for a key as (response, is_fresh), or None if there is none
+    def _load(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT url, body, content_type, etag, last_modified, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        url, body, content_type, etag, last_modified, fetched_at = row
+        headers = {'Content-Type': content_type}
+        if etag:
+            headers['ETag'] = etag
+        if last_modified:
+            headers['Last-Modified'] = last_modified
+        response = CachedResponse(url, 200, headers, zlib.decompress(body))
+        return response, time.time() - fetched_at < self.ttl
+
+    # Return a cached response if it is still fresh (or any cached response in offline mode)
+    def lookup(self, key):
+        entry = self._load(key)
+        if entry is not None and (entry[1] or self.offline):
+            return entry[0]
+        return None
+
+    # Store a successful response body under a key
+    def put(self, key, url, content, headers=None):
+        headers = headers or {}
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, zlib.compress(content), headers.get('Content-Type', 'application/json'),
+                 headers.get('ETag'), headers.get('Last-Modified'), time.time()),
+            )
+            self.connection.commit()
+
+    # GET through the cache. before_request is called only when the network is actually used,
+    # so that cache hits do not consume rate-limit tokens
+    def get(self, url, params=None, key=None, session=None, before_request=None, headers=None):
+        key = key or (f"{url}?{urlencode(sorted(params.items()), doseq=True)}" if params else url)
+        entry = self._load(key)
+        if entry is not None and (entry[1] or self.offline):
+            return entry[0]
+        if self.offline:
+            raise CacheMiss(f"Offline mode: no cached response for {key}")
+
+        # Revalidate a stale entry instead of downloading it again
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry[0].headers.get('ETag'):
+                request_headers['If-None-Match'] = entry[0].headers['ETag']
+            if entry[0].headers.get('Last-Modified'):
+                request_headers['If-Modified-Since'] = entry[0].headers['Last-Modified']
+
+        if before_request:
+            before_request()
+        response = (session or requests).get(url, params=params, headers=request_headers or None)
+
+        if response.status_code == 304 and entry is not None:
+            with self.lock:
+                self.connection.execute("UPDATE responses SET fetched_at = ? WHERE key = ?", (time.time(), key))
+                self.connection.commit()
+            return entry[0]
+        if response.status_code == 200:
+            self.put(key, url, response.content, response.headers)
+        return response
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+# Function to get the cache shared by all scripts, configured through the RESPONSE_CACHE_* variables
+def default_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -1,4 +1,4 @@
-import requests
+from response_cache import default_cache
 
 def get_top_papers(title):
     # API endpoint
@@ -13,8 +13,8 @@ def get_top_papers(title):
     }
 
     try:
-        # Send the request to the API
-        response = requests.get(endpoint, params=params)
+        # Send the request to the API (or serve it from the local cache)
+        response = default_cache().get(endpoint, params=params)
 
         # Check if the request was successful
         if response.status_code == 200:
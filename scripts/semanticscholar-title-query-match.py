@@ -1,5 +1,5 @@
-import requests
 from stringmatch import Ratio
+from response_cache import default_cache
 
 # Initialize the Ratio class from stringmatch library
 ratio = Ratio()
@@ -14,8 +14,8 @@ def get_paper_data(title):
         'fields': 'paperId,title,matchScore,authors,citations.title,citations.abstract,embedding.specter_v2,fieldsOfStudy'
     }
 
-    # Send the request to the API
-    response = requests.get(endpoint, params=params)
+    # Send the request to the API (or serve it from the local cache)
+    response = default_cache().get(endpoint, params=params)
     
     # Check if the request was successful
     if response.status_code == 200:
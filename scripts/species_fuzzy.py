@@ -0,0 +1,128 @@
+import os
+from collections import Counter
+
+from entity_normalization import AliasIndex, EntityNormalizer
+from extraction_store import iter_extractions
+
+# Function to compute the Levenshtein distance of two strings, giving up with limit + 1 as soon as
+# the distance is known to exceed limit
+def bounded_levenshtein(first, second, limit):
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    if len(first) > len(second):
+        first, second = second, first
+    previous = list(range(len(first) + 1))
+    for row, character in enumerate(second, 1):
+        current = [row]
+        for column, other in enumerate(first, 1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1,
+                               previous[column - 1] + (character != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+# Function to scale the allowed edit distance with the length of a name: short names differ in a letter
+# or two by meaning rather than by typo
+def max_distance(name, long_distance=2):
+    if len(name) < 8:
+        return 0
+    if len(name) < 14:
+        return min(1, long_distance)
+    return long_distance
+
+# Function to list the trigrams of a name, padded so that its first and last letters count as much as the others
+def trigrams(name):
+    padded = f"  {name} "
+    return {padded[start:start + 3] for start in range(len(padded) - 2)}
+
+# Inverted index from trigrams to the names containing them. An edit changes at most three trigrams, so a name
+# within distance k of another shares at least one of any 3k + 1 of its trigrams; a query therefore only reads
+# the postings of the 3k + 1 rarest trigrams of the name, then verifies the candidates with bounded_levenshtein
+class TrigramIndex:
+    def __init__(self, names=()):
+        self.postings = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        for trigram in trigrams(name):
+            self.postings.setdefault(trigram, []).append(name)
+
+    # Return (distance, name) for every indexed name within radius of the query, closest first
+    def query(self, name, radius):
+        grams = sorted(trigrams(name), key=lambda trigram: (len(self.postings.get(trigram, ())), trigram))
+        candidates = set()
+        for trigram in grams[:3 * radius + 1]:
+            candidates.update(self.postings.get(trigram, ()))
+        matches = []
+        for other in candidates:
+            distance = bounded_levenshtein(name, other, radius)
+            if distance <= radius:
+                matches.append((distance, other))
+        return sorted(matches)
+
+# Function to count the canonical species names of an extraction output folder or store, after the
+# normalization rules and the aliases already in the index
+def species_frequencies(extractions_path, alias_index_path=None):
+    normalizer = EntityNormalizer(alias_index_path)
+    frequencies = Counter()
+    for data in iter_extractions(extractions_path):
+        for species in data.get('species') or []:
+            if isinstance(species, dict) and isinstance(species.get('name'), str):
+                frequencies[normalizer.canonical('species', species['name'])] += 1
+    return frequencies
+
+# Function to cluster a vocabulary of species names around their most frequent spellings. Names are visited
+# from the most frequent down; a name within the length-scaled distance of a cluster's canonical name joins the
+# closest such cluster, and any other name starts a cluster of its own. Comparing with canonical names only
+# keeps near-misses from chaining distinct species into one cluster, and each lookup in the trigram index of
+# canonical names reads only short postings lists, so the cost grows about linearly with the vocabulary.
+# Names starting with different letters are not merged, since a different first letter usually means a
+# different genus. Returns clusters of two or more names, each with its canonical name first, largest first
+def cluster_species(frequencies, long_distance=2):
+    names = sorted(frequencies, key=lambda name: (-frequencies[name], len(name), name))
+    rank = {name: position for position, name in enumerate(names)}
+    index = TrigramIndex()
+    clusters = {}
+    for name in names:
+        radius = max_distance(name, long_distance)
+        # Both names must allow the distance, so a long name does not join a short one
+        matches = [(distance, rank[other], other) for distance, other in index.query(name, radius)
+                   if other[:1] == name[:1] and distance <= max_distance(other, long_distance)] if radius else []
+        if matches:
+            clusters[min(matches)[2]].append(name)
+        else:
+            index.add(name)
+            clusters[name] = [name]
+    clusters = [cluster for cluster in clusters.values() if len(cluster) > 1]
+    return sorted(clusters, key=lambda cluster: (-sum(frequencies[name] for name in cluster), cluster[0]))
+
+# Function to record every clustered name as an alias of its cluster's canonical name
+def write_clusters(clusters, alias_index_path):
+    aliases = AliasIndex.load(alias_index_path) if os.path.exists(alias_index_path) else AliasIndex()
+    aliases.add_many('species', [(name, cluster[0]) for cluster in clusters for name in cluster[1:]])
+    aliases.save(alias_index_path)
+
+if __name__ == "__main__":
+    extractions_path = input("Enter the extraction output folder or store file: ").strip()
+    alias_index_path = input("Enter the path to the alias index file (created if missing): ").strip()
+    long_distance = int(input("Enter the edit distance allowed for long names (default 2): ").strip() or 2)
+    frequencies = species_frequencies(extractions_path, alias_index_path)
+    print(f"{len(frequencies)} distinct species names")
+
+    query = input("Enter a species name to look up, or leave empty to cluster all names: ").strip()
+    if query:
+        name = EntityNormalizer(alias_index_path).canonical('species', query)
+        for distance, other in TrigramIndex(frequencies).query(name, max(1, max_distance(name, long_distance))):
+            print(f"{distance}  {other} ({frequencies[other]} mentions)")
+    else:
+        clusters = cluster_species(frequencies, long_distance)
+        for cluster in clusters[:50]:
+            print(f"{cluster[0]} <- {', '.join(cluster[1:])}")
+        if len(clusters) > 50:
+            print(f"... and {len(clusters) - 50} more clusters")
+        merged = sum(len(cluster) - 1 for cluster in clusters)
+        if clusters and input(f"Write {merged} names as aliases into {alias_index_path}? (y/N): ").strip().lower() == "y":
+            write_clusters(clusters, alias_index_path)
+            print(f"Alias index updated: {alias_index_path}")